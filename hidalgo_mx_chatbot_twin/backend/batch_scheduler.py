@@ -0,0 +1,102 @@
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Any, Dict
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """
+    Micro-batches concurrent generation requests for a transformers
+    text-generation pipeline. Prompts are collected for up to `window_ms`
+    after the first one arrives (or until `max_batch_size` are waiting) and
+    run as one padded batched call; each caller gets its own result back.
+    """
+
+    def __init__(self, pipe, max_batch_size: int = 4, window_ms: float = 10):
+        self.pipe = pipe
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = window_ms / 1000
+        self._queue = queue.Queue()
+        # Guards the closed flag so no prompt is enqueued behind the shutdown sentinel
+        self._closed = False
+        self._close_lock = threading.Lock()
+
+        # Batched generation needs a pad token, padded on the left for decoder-only models
+        tokenizer = pipe.tokenizer
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+
+        self.batch_sizes = Histogram(buckets=(1, 2, 4, 8, 16, 32))
+        self.latency_ms = Histogram()
+        self._thread = threading.Thread(target=self._loop, name="generation-batcher", daemon=True)
+        self._thread.start()
+
+    def generate(self, prompt: str) -> str:
+        """Blocking: enqueue prompt and wait for its generated text."""
+        future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("Generation batcher is closed; the generator was unloaded")
+            self._queue.put((prompt, future, time.perf_counter()))
+        return future.result()
+
+    def close(self) -> None:
+        """Stop after the prompts already queued; later generate() calls raise RuntimeError."""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.perf_counter() + self.window
+            closing = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            self._run(batch)
+            if closing:
+                return
+
+    def _run(self, batch) -> None:
+        prompts = [prompt for prompt, _, _ in batch]
+        self.batch_sizes.observe(len(batch))
+        try:
+            outputs = self.pipe(prompts, batch_size=len(prompts))
+        except Exception as e:
+            logger.error(f"Batched generation failed for {len(batch)} prompts: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        now = time.perf_counter()
+        for (_, future, enqueued_at), output in zip(batch, outputs):
+            self.latency_ms.observe((now - enqueued_at) * 1000)
+            future.set_result(output[0]["generated_text"])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000,
+            "batch_size": self.batch_sizes.stats(),
+            "latency_ms": self.latency_ms.stats(),
+        }
@@ -0,0 +1,105 @@
+"""
+clean_text against the original per-call re.sub implementation: output
+identity and time per document.
+
+Identity is checked on the benchmark texts and on randomized documents built
+from the fragments the patterns care about (URLs, "Página N de M" footers,
+question marks, blank lines with mixed whitespace). Texts come from the text
+cache (raw pdfminer output is not cached, so cached texts are cleaned a second
+time), from PDFs extracted with pdfminer, or from synthetic pages.
+
+Usage:
+    python bench_clean_text.py [--text-cache text_cache] [--pdf-dir documentos_pdf] [--pages 300] [--fuzz 100000]
+"""
+import argparse
+import gzip
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+from pdf_extraction import clean_text
+
+FRAGMENTS = [
+    "Página", "de", "3", "45", " ", "  ", "\t", "\n", "\n\n", " \n ", "\r\n", "\x0c", "\xa0", "\x85",
+    "?", "¿", "http://x", "https://hidalgo.gob.mx/a?b=1", "texto", "Artículo 5.",
+]
+
+
+def reference_clean_text(text: str) -> str:
+    """clean_text as it was before the patterns were precompiled (CLEAN_TEXT_VERSION 1)."""
+    patterns = [
+        r'http\S+', r'Página\s*\d+\s*de\s*\d+',
+        r'^\s*$', r'\?'
+    ]
+    for pattern in patterns:
+        text = re.sub(pattern, '', text, flags=re.MULTILINE)
+    return re.sub(r'\n\s*\n', '\n\n', text)
+
+
+def synthetic_document(pages: int) -> str:
+    line = ("Programa de Apoyo al Campo Huasteco. ¿Quién puede solicitarlo? Consulta "
+            "https://s-campo.hidalgo.gob.mx/programas?id=12 para más información.\n")
+    return "".join(line * 30 + f"\n   \n\nPágina {n} de {pages}\n\x0c" for n in range(1, pages + 1))
+
+
+def load_texts(args: argparse.Namespace) -> List[Tuple[str, str]]:
+    texts = []
+    if args.text_cache and Path(args.text_cache).is_dir():
+        for path in sorted(Path(args.text_cache).glob("*.txt.gz"))[:args.limit]:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                texts.append((path.name, f.read()))
+    if args.pdf_dir and Path(args.pdf_dir).is_dir():
+        from pdfminer.high_level import extract_text
+        for path in sorted(Path(args.pdf_dir).glob("*.pdf"))[:args.limit]:
+            texts.append((path.name, extract_text(str(path))))
+    texts.append((f"synthetic ({args.pages} pages)", synthetic_document(args.pages)))
+    return texts
+
+
+def best_ms(fn: Callable[[str], str], text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def fuzz(cases: int, seed: int = 0) -> int:
+    rng = random.Random(seed)
+    for _ in range(cases):
+        text = "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 16)))
+        if clean_text(text) != reference_clean_text(text):
+            print(f"Mismatch on {text!r}")
+            return 1
+    print(f"Fuzz: {cases} random documents identical")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--text-cache", default="text_cache")
+    parser.add_argument("--pdf-dir", default=None, help="also extract and clean these PDFs (slow: runs pdfminer)")
+    parser.add_argument("--limit", type=int, default=20, help="max files per source")
+    parser.add_argument("--pages", type=int, default=300, help="pages in the synthetic document")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fuzz", type=int, default=100000)
+    args = parser.parse_args()
+
+    failures = 0
+    print(f"{'text':<40} {'chars':>10} {'reference ms':>13} {'clean_text ms':>14} {'speedup':>8}  identical")
+    for name, text in load_texts(args):
+        identical = clean_text(text) == reference_clean_text(text)
+        failures += not identical
+        ref_ms = best_ms(reference_clean_text, text, args.repeat)
+        new_ms = best_ms(clean_text, text, args.repeat)
+        print(f"{name[:40]:<40} {len(text):>10} {ref_ms:>13.2f} {new_ms:>14.2f} {ref_ms / new_ms:>7.1f}x  {identical}")
+
+    failures += fuzz(args.fuzz)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Recall@k vs latency of the FAISS index types against the exact flat baseline.
+
+Vectors come from the persisted index (every access sub-index, or the older
+single-index layout) or, to see how the types behave at a larger scale than
+the current corpus, from synthetic clustered unit vectors. A held-out sample
+of the vectors is used as queries; ground truth is an exact flat search over
+the rest. Queries run one at a time, as they do when serving.
+
+Usage:
+    python bench_index.py [--index-path faiss_index] [--synthetic 100000] [--k 4]
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import faiss
+from index_factory import INDEX_TYPES, build_index, index_config, index_kind, min_vectors, reconstruct_all, set_search_params
+from vector_index import ACCESS_LEVELS
+
+NPROBE_SWEEP = (1, 4, 8, 16, 32, 64)
+EF_SEARCH_SWEEP = (16, 32, 64, 128, 256)
+
+
+def load_vectors(index_path: str) -> np.ndarray:
+    paths = [os.path.join(index_path, access, "index.faiss") for access in ACCESS_LEVELS]
+    paths.append(os.path.join(index_path, "index.faiss"))
+    parts = [reconstruct_all(faiss.read_index(p)) for p in paths if os.path.exists(p)]
+    if not parts:
+        sys.exit(f"No index.faiss found under {index_path}")
+    return np.vstack(parts).astype("float32")
+
+
+def synthetic_vectors(n: int, dim: int = 384, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run_queries(index: faiss.Index, queries: np.ndarray, k: int):
+    labels = np.empty((len(queries), k), dtype="int64")
+    latencies = np.empty(len(queries))
+    for i, query in enumerate(queries):
+        t0 = time.perf_counter()
+        _, labels[i] = index.search(query[None, :], k)
+        latencies[i] = (time.perf_counter() - t0) * 1000
+    return labels, latencies
+
+
+def recall_at_k(labels: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(row[row >= 0]) & set(ref)) for row, ref in zip(labels, truth))
+    return hits / truth.size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-path", default="faiss_index")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of the stored index")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.synthetic) if args.synthetic else load_vectors(args.index_path)
+    rng = np.random.default_rng(1)
+    order = rng.permutation(len(vectors))
+    queries, base = vectors[order[:args.queries]], vectors[order[args.queries:]]
+    print(f"Base vectors: {len(base)}  queries: {len(queries)}  dim: {base.shape[1]}  k: {args.k}\n")
+
+    flat = faiss.IndexFlatL2(base.shape[1])
+    flat.add(base)
+    truth, flat_latencies = run_queries(flat, queries, args.k)
+
+    print(f"{'index':<10} {'param':<12} {'recall@k':>9} {'mean ms':>9} {'p95 ms':>8} {'build s':>8} {'size MB':>8}")
+    size_mb = faiss.serialize_index(flat).nbytes / 1024 ** 2
+    print(f"{'flat':<10} {'-':<12} {1.0:>9.3f} {flat_latencies.mean():>9.3f} "
+          f"{np.percentile(flat_latencies, 95):>8.3f} {0.0:>8.2f} {size_mb:>8.1f}")
+
+    for index_type in INDEX_TYPES[1:]:
+        config = index_config(index_type)
+        if len(base) < min_vectors(config):
+            print(f"{index_type:<10} skipped: needs {min_vectors(config)} vectors to train (try --synthetic)")
+            continue
+        t0 = time.perf_counter()
+        index = build_index(base, config)
+        index.add(base)
+        build_seconds = time.perf_counter() - t0
+        size_mb = faiss.serialize_index(index).nbytes / 1024 ** 2
+
+        if index_kind(index) == "hnsw":
+            sweep = [("efSearch", ef, {"ef_search": ef}) for ef in EF_SEARCH_SWEEP]
+        else:
+            sweep = [("nprobe", nprobe, {"nprobe": nprobe}) for nprobe in NPROBE_SWEEP]
+        for name, value, params in sweep:
+            set_search_params(index, **params)
+            labels, latencies = run_queries(index, queries, args.k)
+            print(f"{index_type:<10} {f'{name}={value}':<12} {recall_at_k(labels, truth):>9.3f} "
+                  f"{latencies.mean():>9.3f} {np.percentile(latencies, 95):>8.3f} {build_seconds:>8.2f} {size_mb:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
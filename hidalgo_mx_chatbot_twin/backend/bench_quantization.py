@@ -0,0 +1,143 @@
+"""
+Benchmark fp32 vs int8 dynamic quantization of a generator on CPU.
+
+Each mode runs in its own subprocess so memory is measured in isolation.
+Peak RSS of the int8 run still includes the fp32 weights it is quantized
+from, so resident RSS after loading is reported as well; that is what a
+long-running replica holds.
+Greedy decoding over a fixed question set makes answers comparable; overlap
+is the token-level F1 of each int8 answer against the fp32 answer.
+
+Usage:
+    python bench_quantization.py [--model phi-2] [--max-new-tokens 64]
+"""
+import argparse
+import gc
+import json
+import subprocess
+import sys
+import time
+from collections import Counter
+
+QUESTIONS = [
+    "¿Cómo me registro a la beca de transporte?",
+    "¿Qué requisitos necesito para el apoyo a adultos mayores?",
+    "¿Qué programas hay para productores del campo en la Huasteca?",
+    "¿Dónde puedo entregar mis documentos para un programa social?",
+    "¿Qué apoyos existen para madres jefas de familia?",
+]
+CONTEXT = (
+    "Los programas sociales del Gobierno del Estado de Hidalgo requieren identificación oficial, "
+    "CURP y comprobante de domicilio. El registro se realiza en las oficinas de la Secretaría de "
+    "Bienestar o en línea en el portal del programa durante el periodo de convocatoria."
+)
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+        # ru_maxrss is KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 1024 ** 2
+        except Exception:
+            return 0.0
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    except Exception:
+        return 0.0
+
+
+def run_worker(model_name: str, quantize: str, max_new_tokens: int) -> dict:
+    import torch
+    from transformers import AutoTokenizer
+    from model_registry import model_spec, load_causal_lm
+
+    hf_id = model_spec(model_name)["hf_id"]
+    tokenizer = AutoTokenizer.from_pretrained(hf_id)
+    start = time.perf_counter()
+    model = load_causal_lm(hf_id, None if quantize == "fp32" else quantize)
+    load_seconds = time.perf_counter() - start
+    gc.collect()
+    resident_mb = current_rss_mb()
+
+    answers, generated, gen_seconds = [], 0, 0.0
+    for question in QUESTIONS:
+        prompt = f"<|system|>\nResponde usando el contexto.\nContexto:\n{CONTEXT}</s>\n<|user|>\n{question}</s>\n<|assistant|>\n"
+        inputs = tokenizer(prompt, return_tensors="pt")
+        t0 = time.perf_counter()
+        with torch.inference_mode():
+            output = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False)
+        gen_seconds += time.perf_counter() - t0
+        new_tokens = output[0][inputs["input_ids"].shape[1]:]
+        generated += len(new_tokens)
+        answers.append(tokenizer.decode(new_tokens, skip_special_tokens=True).strip())
+
+    return {
+        "mode": quantize,
+        "load_s": round(load_seconds, 2),
+        "tokens_per_s": round(generated / gen_seconds, 2) if gen_seconds else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "resident_mb": round(resident_mb, 1),
+        "answers": answers,
+    }
+
+
+def token_f1(candidate: str, reference: str) -> float:
+    cand, ref = candidate.lower().split(), reference.lower().split()
+    common = sum((Counter(cand) & Counter(ref)).values())
+    if not cand or not ref or not common:
+        return float(cand == ref)
+    precision, recall = common / len(cand), common / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="phi-2")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--worker", choices=["fp32", "int8"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.model, args.worker, args.max_new_tokens), ensure_ascii=False))
+        return
+
+    results = {}
+    for mode in ("fp32", "int8"):
+        print(f"Running {mode}...", file=sys.stderr)
+        out = subprocess.run(
+            [sys.executable, __file__, "--model", args.model, "--max-new-tokens", str(args.max_new_tokens), "--worker", mode],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results[mode] = json.loads(out.strip().splitlines()[-1])
+
+    overlap = [token_f1(q, b) for q, b in zip(results["int8"]["answers"], results["fp32"]["answers"])]
+    print(f"\nModel: {args.model}  questions: {len(QUESTIONS)}  max_new_tokens: {args.max_new_tokens}")
+    print(f"{'mode':<6} {'load s':>8} {'tokens/s':>10} {'peak RSS MB':>12} {'resident MB':>12}")
+    for mode in ("fp32", "int8"):
+        r = results[mode]
+        print(f"{mode:<6} {r['load_s']:>8} {r['tokens_per_s']:>10} {r['peak_rss_mb']:>12} {r['resident_mb']:>12}")
+    fp32, int8 = results["fp32"], results["int8"]
+    if fp32["tokens_per_s"]:
+        print(f"\nSpeedup: {int8['tokens_per_s'] / fp32['tokens_per_s']:.2f}x")
+    if int8["resident_mb"]:
+        print(f"Resident memory ratio (fp32/int8): {fp32['resident_mb'] / int8['resident_mb']:.2f}x")
+    print(f"Answer overlap vs fp32 (token F1): mean {sum(overlap) / len(overlap):.3f}, min {min(overlap):.3f}")
+
+
+if __name__ == "__main__":
+    main()
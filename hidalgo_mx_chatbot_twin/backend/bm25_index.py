@@ -0,0 +1,155 @@
+import os
+import re
+import gzip
+import json
+import math
+import logging
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+BM25_FILE = "bm25.json.gz"
+
+_TOKEN_RE = re.compile(r"\w+")
+# Very common Spanish words; they carry no signal and make postings long
+STOPWORDS = frozenset("""
+a al algo como con de del donde el ella en era es esta este esto fue ha hay la las le les lo los mas me mi muy
+no o para pero por que se si sin sobre su sus te tu un una uno unos unas y ya
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-insensitive word tokens; numbers are kept (article numbers, years)."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [t for t in _TOKEN_RE.findall(text) if t not in STOPWORDS]
+
+
+def term_frequencies(text: str) -> Dict[str, int]:
+    return dict(Counter(tokenize(text)))
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over the same chunks as the FAISS sub-indexes,
+    keyed by docstore id. Updated incrementally with add/delete and saved
+    as faiss_index/bm25.json.gz; postings are rebuilt in memory on load.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # doc id -> (access level, term frequencies)
+        self.docs: Dict[str, Tuple[str, Dict[str, int]]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_length = 0
+        # (program name, partitions, limit) -> matching chunk ids; cleared whenever the index changes
+        self._program_cache: Dict[Tuple[str, Tuple[str, ...], int], List[str]] = {}
+
+    @classmethod
+    def load(cls, index_path: str) -> Optional["BM25Index"]:
+        path = os.path.join(index_path, BM25_FILE)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Error loading BM25 index from {path}: {e}")
+            return None
+        index = cls(data.get("k1", 1.5), data.get("b", 0.75))
+        for doc_id, (access, tf) in data["docs"].items():
+            index._add_doc(doc_id, access, tf)
+        return index
+
+    def save(self, index_path: str) -> None:
+        path = os.path.join(index_path, BM25_FILE)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": self.docs}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _add_doc(self, doc_id: str, access: str, tf: Dict[str, int]) -> None:
+        self.docs[doc_id] = (access, tf)
+        self.lengths[doc_id] = sum(tf.values())
+        self.total_length += self.lengths[doc_id]
+        for term, count in tf.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+
+    def add(self, ids: Iterable[str], texts: Iterable[str], accesses: Iterable[str]) -> None:
+        self.add_counts(ids, (term_frequencies(text) for text in texts), accesses)
+
+    def add_counts(self, ids: Iterable[str], tfs: Iterable[Dict[str, int]], accesses: Iterable[str]) -> None:
+        """Add chunks already run through term_frequencies (tokenized ahead of time, e.g. outside a lock)."""
+        self._program_cache.clear()
+        for doc_id, tf, access in zip(ids, tfs, accesses):
+            if doc_id in self.docs:
+                self.delete([doc_id])
+            self._add_doc(doc_id, access, tf)
+
+    def delete(self, ids: Iterable[str]) -> None:
+        self._program_cache.clear()
+        for doc_id in ids:
+            entry = self.docs.pop(doc_id, None)
+            if entry is None:
+                continue
+            _, tf = entry
+            self.total_length -= self.lengths.pop(doc_id)
+            for term in tf:
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(doc_id, None)
+                    if not posting:
+                        del self.postings[term]
+
+    def _scores(self, terms: Iterable[str], allowed: Set[str]) -> Tuple[Dict[str, float], Dict[str, int]]:
+        """BM25 score and number of matched terms per chunk of the allowed access levels."""
+        scores: Dict[str, float] = {}
+        matched: Dict[str, int] = {}
+        if not self.docs:
+            return scores, matched
+        n = len(self.docs)
+        avg_length = self.total_length / n or 1.0
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                if self.docs[doc_id][0] not in allowed:
+                    continue
+                norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+                matched[doc_id] = matched.get(doc_id, 0) + 1
+        return scores, matched
+
+    def search(self, query: str, partitions: Iterable[str], k: int = 4) -> List[Tuple[str, float]]:
+        """Top-k (doc id, BM25 score) among chunks of the given access levels, best first."""
+        scores, _ = self._scores(set(tokenize(query)), set(partitions))
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def program_chunks(self, name: str, partitions: Iterable[str], limit: int = 2) -> List[str]:
+        """
+        Ids of the chunks that best mention a program name, for boosting programs
+        chosen by the rules engine. A chunk must contain every term of a short
+        name, or all but one of a longer one ("Huasteco" vs "Huasteca").
+        Memoized until the next add/delete, so repeat lookups are a dict hit.
+        """
+        partitions = tuple(partitions)
+        key = (name, partitions, limit)
+        cached = self._program_cache.get(key)
+        if cached is not None:
+            return cached
+        terms = set(tokenize(name))
+        required = len(terms) if len(terms) <= 2 else len(terms) - 1
+        scores, matched = self._scores(terms, set(partitions))
+        candidates = [doc_id for doc_id in scores if matched[doc_id] >= required]
+        candidates.sort(key=lambda doc_id: (matched[doc_id], scores[doc_id]), reverse=True)
+        self._program_cache[key] = candidates[:limit]
+        return self._program_cache[key]
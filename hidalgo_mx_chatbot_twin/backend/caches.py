@@ -0,0 +1,225 @@
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+_WHITESPACE = re.compile(r'\s+')
+_EDGE_PUNCTUATION = '¿?¡!.,;: '
+
+
+def normalize_question(text: str) -> str:
+    """Canonical form of a user question used as cache key."""
+    text = unicodedata.normalize('NFC', text).casefold()
+    return _WHITESPACE.sub(' ', text).strip(_EDGE_PUNCTUATION)
+
+
+class LRUCache:
+    """Thread-safe LRU cache with optional per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings model and caches embed_query results keyed by the
+    normalized question, so repeated questions skip the encoder.
+    Document embedding is passed straight through.
+    """
+
+    def __init__(self, base: Embeddings, max_size: int = 1024, ttl: Optional[float] = 3600):
+        self.base = base
+        self.cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_question(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.base.embed_query(text)
+            self.cache.put(key, vector)
+        return vector
+
+
+class _PartitionVectors:
+    """Unit-normalized query embeddings of one response cache partition, one matrix row per question."""
+
+    def __init__(self):
+        self.questions: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.matrix: Optional[np.ndarray] = None
+
+    def set(self, question: str, vector: List[float]) -> None:
+        row = np.asarray(vector, dtype="float32")
+        row /= np.linalg.norm(row) or 1.0
+        if question in self.rows:
+            self.matrix[self.rows[question]] = row
+            return
+        self.rows[question] = len(self.questions)
+        self.questions.append(question)
+        self.matrix = row[None, :] if self.matrix is None else np.vstack([self.matrix, row])
+
+    def remove(self, question: str) -> None:
+        index = self.rows.pop(question, None)
+        if index is None:
+            return
+        del self.questions[index]
+        self.matrix = np.delete(self.matrix, index, axis=0)
+        for moved in self.questions[index:]:
+            self.rows[moved] -= 1
+
+    def best(self, vector: List[float]) -> Tuple[Optional[str], float]:
+        """Most similar cached question and its cosine similarity."""
+        if not self.questions:
+            return None, 0.0
+        query = np.asarray(vector, dtype="float32")
+        scores = self.matrix @ (query / (np.linalg.norm(query) or 1.0))
+        index = int(np.argmax(scores))
+        return self.questions[index], float(scores[index])
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of generated answers. Entries are partitioned by
+    everything that shapes the answer besides the question (model, access
+    level, prioritized programs, user profile) so answers never cross roles.
+    Within a partition a lookup matches the normalized question exactly or,
+    when similarity_threshold is set, the most similar cached question by
+    cosine similarity of the query embeddings.
+
+    invalidate() starts a new generation; callers read `generation` before
+    answering and pass it to put(), so an answer built from the index or
+    rules that were just replaced is not cached.
+    """
+
+    def __init__(self, max_size: int = 512, similarity_threshold: Optional[float] = None):
+        self.max_size = max_size
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()  # (question, partition) -> response
+        self._vectors: Dict[Tuple, _PartitionVectors] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        return self.invalidations
+
+    @staticmethod
+    def partition_key(model_name: str, is_advisor: bool, prioritized_programs: List[str], user_info: Dict[str, Any]) -> Tuple:
+        return (
+            model_name,
+            "advisor" if is_advisor else "public",
+            tuple(sorted(prioritized_programs)),
+            tuple(sorted((k, repr(v)) for k, v in user_info.items())),
+        )
+
+    def get(self, question: str, partition: Tuple, vector: Optional[List[float]] = None) -> Optional[str]:
+        key = (normalize_question(question), partition)
+        with self._lock:
+            response = self._entries.get(key)
+            if response is None and vector is not None and self.similarity_threshold and partition in self._vectors:
+                similar, score = self._vectors[partition].best(vector)
+                if similar is not None and score >= self.similarity_threshold:
+                    key = (similar, partition)
+                    response = self._entries[key]
+                    self.semantic_hits += 1
+            if response is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return response
+
+    def put(self, question: str, partition: Tuple, response: str, vector: Optional[List[float]] = None, generation: Optional[int] = None) -> None:
+        if self.max_size <= 0:
+            return
+        key = (normalize_question(question), partition)
+        with self._lock:
+            if generation is not None and generation != self.invalidations:
+                # Invalidated while this answer was being generated
+                return
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            if vector is not None:
+                self._vectors.setdefault(partition, _PartitionVectors()).set(key[0], vector)
+            elif partition in self._vectors:
+                self._vectors[partition].remove(key[0])
+            while len(self._entries) > self.max_size:
+                (old_question, old_partition), _ = self._entries.popitem(last=False)
+                vectors = self._vectors.get(old_partition)
+                if vectors is not None:
+                    vectors.remove(old_question)
+                    if not vectors.questions:
+                        del self._vectors[old_partition]
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,83 @@
+import json
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Iterator, List, Tuple, Union
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+CHUNK_STORE_FILE = "chunks.sqlite3"
+
+
+class ChunkStore(Docstore, AddableMixin):
+    """
+    SQLite docstore for the FAISS sub-indexes: chunk text and metadata by
+    docstore id, plus each sub-index's position -> id map. Chunks are read
+    only when a search hits them, so the corpus text never sits in memory.
+
+    Writes stay in an open transaction until commit(), which PartitionedIndex
+    calls when it saves the FAISS files, so readers of the database file never
+    see chunks that a saved index does not know about.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets other worker processes read while this one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS id_map (partition TEXT NOT NULL, position INTEGER NOT NULL, doc_id TEXT NOT NULL, "
+            "PRIMARY KEY (partition, position))"
+        )
+        self._conn.commit()
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute("SELECT page_content, metadata FROM chunks WHERE id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        rows = [(doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False)) for doc_id, doc in texts.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO chunks (id, page_content, metadata) VALUES (?, ?, ?)", rows)
+
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(doc_id,) for doc_id in ids])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM id_map")
+
+    def iter_chunks(self) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """All stored (id, text, metadata); used to rebuild derived indexes."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, page_content, metadata FROM chunks").fetchall()
+        for doc_id, text, metadata in rows:
+            yield doc_id, text, json.loads(metadata)
+
+    def id_map(self, partition: str) -> Dict[int, str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT position, doc_id FROM id_map WHERE partition = ?", (partition,)).fetchall()
+        return dict(rows)
+
+    def set_id_map(self, partition: str, index_to_docstore_id: Dict[int, str]) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM id_map WHERE partition = ?", (partition,))
+            self._conn.executemany(
+                "INSERT INTO id_map (partition, position, doc_id) VALUES (?, ?, ?)",
+                [(partition, position, doc_id) for position, doc_id in index_to_docstore_id.items()]
+            )
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
@@ -0,0 +1,102 @@
+import logging
+from typing import Any, Callable, List, Optional, Tuple
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# Rough characters per token when no tokenizer is at hand (Spanish text, Llama-style vocabularies)
+CHARS_PER_TOKEN = 4
+# A truncated span shorter than this is dropped rather than packed
+MIN_SPAN_TOKENS = 32
+# Chunks separated by at most this many characters (whitespace the splitter stripped) count as adjacent
+MAX_GAP = 2
+
+
+class _Span:
+    """A contiguous stretch of one source section, built from one or more retrieved chunks."""
+
+    def __init__(self, doc: Document, rank: int):
+        self.key = (doc.metadata.get("source"), doc.metadata.get("section"))
+        self.start = doc.metadata.get("start_index")
+        self.end = self.start + len(doc.page_content)
+        self.text = doc.page_content
+        self.rank = rank
+
+    def absorb(self, other: "_Span") -> None:
+        # other starts within our text (chunk_overlap) or right after it
+        if other.start > self.end:
+            self.text += "\n" + other.text
+        elif other.end > self.end:
+            self.text += other.text[self.end - other.start:]
+        self.end = max(self.end, other.end)
+        self.rank = min(self.rank, other.rank)
+
+
+def merge_chunks(docs: List[Document]) -> List[Tuple[str, int]]:
+    """
+    Collapse retrieved chunks into (text, best rank) spans: chunks of the same
+    source section that overlap or touch are merged with the shared text kept
+    once, and exact duplicates are dropped. Chunks without a start_index
+    (indexes built before it was recorded) are kept as they are.
+    """
+    spans, loose, seen = [], [], set()
+    for rank, doc in enumerate(docs):
+        if doc.page_content in seen:
+            continue
+        seen.add(doc.page_content)
+        if doc.metadata.get("start_index") is None:
+            loose.append((doc.page_content, rank))
+        else:
+            spans.append(_Span(doc, rank))
+
+    merged: List[_Span] = []
+    for span in sorted(spans, key=lambda s: (str(s.key), s.start)):
+        last = merged[-1] if merged else None
+        if last is not None and last.key == span.key and span.start <= last.end + MAX_GAP:
+            last.absorb(span)
+        else:
+            merged.append(span)
+    return sorted([(s.text, s.rank) for s in merged] + loose, key=lambda pair: pair[1])
+
+
+def pack_context(docs: List[Document], budget: int, tokenizer: Optional[Any] = None, separator: str = "\n\n") -> str:
+    """
+    Join retrieved chunks (best first) into a context of at most `budget`
+    tokens, measured with the generator's tokenizer. Overlapping and adjacent
+    chunks are merged first; when the budget runs out, the lowest-ranked
+    spans are truncated and then dropped.
+    """
+    count, truncate = _token_functions(tokenizer)
+    separator_tokens = count(separator)
+    packed, used = [], 0
+    spans = merge_chunks(docs)
+    for text, _ in spans:
+        cost = count(text) + (separator_tokens if packed else 0)
+        if used + cost <= budget:
+            packed.append(text)
+            used += cost
+            continue
+        remaining = budget - used - (separator_tokens if packed else 0)
+        # The best span is always kept, truncated if it alone exceeds the budget
+        if remaining >= MIN_SPAN_TOKENS or not packed:
+            packed.append(truncate(text, remaining))
+            used = budget
+        break
+    logger.info(f"Context packed: {len(docs)} chunks -> {len(spans)} spans, {len(packed)} kept, ~{used}/{budget} tokens")
+    return separator.join(packed)
+
+
+def _token_functions(tokenizer: Optional[Any]) -> Tuple[Callable[[str], int], Callable[[str, int], str]]:
+    if tokenizer is None:
+        return (
+            lambda text: -(-len(text) // CHARS_PER_TOKEN),
+            lambda text, n: text[:n * CHARS_PER_TOKEN],
+        )
+
+    def count(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(text: str, n: int) -> str:
+        return tokenizer.decode(tokenizer.encode(text, add_special_tokens=False)[:n])
+
+    return count, truncate
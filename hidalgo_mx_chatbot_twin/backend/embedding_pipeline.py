@@ -0,0 +1,95 @@
+import queue
+import threading
+import time
+import logging
+from typing import List, Iterable, Tuple
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class EmbeddingPipeline:
+    """
+    Overlaps chunk production with embedding: a producer thread drains an
+    iterable of per-file chunk lists (extraction + splitting) into a bounded
+    queue while the calling thread embeds them in fixed-size batches.
+    """
+
+    def __init__(self, embedding_model, batch_size: int = 256, queue_size: int = 8):
+        self.embedding_model = embedding_model
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.last_rate = 0.0  # chunks/second of the last run
+
+    def run(self, document_batches: Iterable[List[Document]]) -> Tuple[List[Document], List[Tuple[str, List[float]]]]:
+        """Returns (documents, [(text, vector), ...]) in production order."""
+        chunk_queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+
+        def put(item) -> None:
+            while not stop.is_set():
+                try:
+                    chunk_queue.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+        def produce() -> None:
+            try:
+                for docs in document_batches:
+                    if stop.is_set():
+                        return
+                    if docs:
+                        put(docs)
+            except BaseException as e:
+                put(e)
+                return
+            put(_DONE)
+
+        producer = threading.Thread(target=produce, name="chunk-producer", daemon=True)
+        producer.start()
+
+        documents = []
+        text_embeddings = []
+        pending = []
+        start = time.perf_counter()
+        embed_seconds = 0.0
+
+        def flush(batch: List[Document]) -> None:
+            nonlocal embed_seconds
+            texts = [d.page_content for d in batch]
+            t0 = time.perf_counter()
+            vectors = self.embedding_model.embed_documents(texts)
+            embed_seconds += time.perf_counter() - t0
+            documents.extend(batch)
+            text_embeddings.extend(zip(texts, vectors))
+            elapsed = time.perf_counter() - start
+            logger.info(f"🧠 Indexando: {len(documents)} fragmentos ({len(documents) / elapsed:.1f} fragmentos/s)...")
+
+        try:
+            while True:
+                item = chunk_queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                pending.extend(item)
+                while len(pending) >= self.batch_size:
+                    flush(pending[:self.batch_size])
+                    pending = pending[self.batch_size:]
+            if pending:
+                flush(pending)
+        finally:
+            stop.set()
+            producer.join(timeout=5)
+
+        elapsed = time.perf_counter() - start
+        self.last_rate = len(documents) / elapsed if elapsed > 0 else 0.0
+        if documents:
+            logger.info(
+                f"✅ Embeddings: {len(documents)} fragmentos en {elapsed:.1f}s "
+                f"({self.last_rate:.1f} fragmentos/s, {embed_seconds:.1f}s en el encoder)"
+            )
+        return documents, text_embeddings
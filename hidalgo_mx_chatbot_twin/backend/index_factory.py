@@ -0,0 +1,142 @@
+import os
+import math
+import logging
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+import faiss
+import settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+# IVF needs ~39 training points per centroid; fewer lists than this are not worth it
+MIN_NLIST = 16
+
+
+def index_config(index_type: Optional[str] = None) -> Dict[str, Any]:
+    """Build-time parameters of the configured index type (recorded in the index manifest)."""
+    index_type = index_type or settings.INDEX_TYPE
+    if index_type not in INDEX_TYPES:
+        logger.warning(f"Unknown INDEX_TYPE '{index_type}', using flat. Options: {', '.join(INDEX_TYPES)}")
+        index_type = "flat"
+    config: Dict[str, Any] = {"type": index_type}
+    if index_type in ("ivf_flat", "ivf_pq"):
+        config["nlist"] = settings.INDEX_NLIST
+    if index_type == "ivf_pq":
+        config["pq_m"] = settings.INDEX_PQ_M
+        config["pq_nbits"] = settings.INDEX_PQ_NBITS
+    if index_type == "hnsw":
+        config["m"] = settings.INDEX_HNSW_M
+        config["ef_construction"] = settings.INDEX_EF_CONSTRUCTION
+    return config
+
+
+def min_vectors(config: Dict[str, Any]) -> int:
+    """Vectors needed to train the configured type; smaller partitions stay flat."""
+    if config["type"] == "ivf_flat":
+        return 39 * MIN_NLIST
+    if config["type"] == "ivf_pq":
+        return 39 * max(MIN_NLIST, 2 ** config["pq_nbits"])
+    return 0
+
+
+def choose_nlist(config: Dict[str, Any], n: int) -> int:
+    nlist = config.get("nlist") or int(4 * math.sqrt(n))
+    return max(1, min(nlist, n // 39))
+
+
+def training_sample(vectors: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    if size <= 0 or len(vectors) <= size:
+        return vectors
+    rng = np.random.default_rng(seed)
+    return vectors[np.sort(rng.choice(len(vectors), size, replace=False))]
+
+
+def build_index(vectors: np.ndarray, config: Dict[str, Any]) -> faiss.Index:
+    """
+    Empty, trained L2 index of the configured type for this corpus. Quantizers
+    are trained on a sample of the vectors; the caller adds them afterwards.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    kind = config["type"] if n >= min_vectors(config) else "flat"
+
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, config["m"])
+        index.hnsw.efConstruction = config["ef_construction"]
+    else:
+        sample = training_sample(vectors, settings.INDEX_TRAIN_SAMPLE)
+        nlist = choose_nlist(config, len(sample))
+        if kind == "ivf_pq":
+            if dim % config["pq_m"]:
+                raise ValueError(f"INDEX_PQ_M={config['pq_m']} must divide the embedding dimension {dim}")
+            description = f"IVF{nlist},PQ{config['pq_m']}x{config['pq_nbits']}"
+        else:
+            description = f"IVF{nlist},Flat"
+        index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+        logger.info(f"Training {description} on {len(sample)} of {n} vectors...")
+        index.train(sample)
+
+    set_search_params(index)
+    return index
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """Apply query-time knobs (IVF nprobe, HNSW efSearch); no-op for flat indexes."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe or settings.INDEX_NPROBE, ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or settings.INDEX_EF_SEARCH
+
+
+def index_kind(index: faiss.Index) -> str:
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        # try_extract_index_ivf returns the generic IndexIVF proxy; downcast to see the concrete type
+        return "ivf_pq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf_flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def reconstruct_all(index: faiss.Index) -> np.ndarray:
+    """Stored vectors in id order (approximate for PQ codes, exact otherwise)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def read_index(path: str, mmap: bool) -> Tuple[faiss.Index, bool]:
+    """
+    Read an index file, memory-mapped read-only when requested and supported,
+    so worker processes share its pages through the page cache instead of each
+    holding a heap copy. Returns (index, mmapped).
+    """
+    if mmap:
+        # MMAP_IFC (faiss >= 1.10) maps flat codes zero-copy; IO_FLAG_MMAP maps IVF lists
+        for flag_name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+            flag = getattr(faiss, flag_name, None)
+            if flag is None:
+                continue
+            try:
+                return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY), True
+            except RuntimeError as e:
+                logger.debug(f"{flag_name} not usable for {path}: {e}")
+        logger.warning(f"Could not memory-map {path}; reading it into memory")
+    return faiss.read_index(path), False
+
+
+def heap_copy(index: faiss.Index) -> faiss.Index:
+    """Writable in-memory copy of a (possibly memory-mapped, read-only) index."""
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def write_index(index: faiss.Index, path: str) -> None:
+    # Replace rather than overwrite: processes that mapped the old file keep a valid mapping
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
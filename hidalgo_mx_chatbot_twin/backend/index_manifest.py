@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+# Held by the worker process that is loading, changing or saving the index
+LOCK_FILE = "index.lock"
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexManifest:
+    """
+    Records what is stored in a persisted FAISS index: the embedding model, the
+    chunker and index settings and, per source file, its content hash and
+    chunk ids. Saved as faiss_index/manifest.json.
+    """
+
+    def __init__(self, embedding_model: str, chunker: Dict[str, Any], index_settings: Optional[Dict[str, Any]] = None, files: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.embedding_model = embedding_model
+        self.chunker = chunker
+        self.index_settings = index_settings or {}
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, index_path: str) -> Optional["IndexManifest"]:
+        path = os.path.join(index_path, MANIFEST_FILE)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return cls(data["embedding_model"], data["chunker"], data.get("index_settings"), data.get("files", {}))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Error loading index manifest from {path}: {e}")
+            return None
+
+    @staticmethod
+    def stamp(index_path: str) -> Optional[Tuple[int, int, int]]:
+        """
+        Identity of the manifest file on disk, or None if there is none. save()
+        replaces the file, so a changed stamp means another save (possibly by
+        another process) happened since the stamp was taken.
+        """
+        try:
+            stat = os.stat(os.path.join(index_path, MANIFEST_FILE))
+            return stat.st_mtime_ns, stat.st_size, stat.st_ino
+        except OSError:
+            return None
+
+    def save(self, index_path: str) -> None:
+        os.makedirs(index_path, exist_ok=True)
+        path = os.path.join(index_path, MANIFEST_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "embedding_model": self.embedding_model,
+                "chunker": self.chunker,
+                "index_settings": self.index_settings,
+                "files": self.files,
+            }, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def is_compatible(self, embedding_model: str, chunker: Dict[str, Any], index_settings: Dict[str, Any]) -> bool:
+        return (
+            self.embedding_model == embedding_model
+            and self.chunker == chunker
+            and self.index_settings == index_settings
+        )
+
+    def changed_files(self, pdf_files: List[Path]) -> Tuple[List[Path], Dict[str, str]]:
+        """Returns (new_or_changed paths, current hashes by name) for pdf_files."""
+        hashes = {}
+        changed = []
+        for pdf_path in pdf_files:
+            try:
+                hashes[pdf_path.name] = file_sha256(pdf_path)
+            except OSError as e:
+                logger.error(f"Error hashing {pdf_path}: {e}")
+                continue
+            entry = self.files.get(pdf_path.name)
+            if not entry or entry.get("sha256") != hashes[pdf_path.name]:
+                changed.append(pdf_path)
+        return changed, hashes
+
+    def diff(self, pdf_files: List[Path]) -> Tuple[List[Path], List[str], Dict[str, str]]:
+        """
+        Compare the manifest against the complete set of files on disk.
+        Returns (new_or_changed paths, deleted source names, current hashes by name).
+        """
+        changed, hashes = self.changed_files(pdf_files)
+        deleted = [name for name in self.files if name not in hashes]
+        return changed, deleted, hashes
+
+    def chunk_ids(self, names: List[str]) -> List[str]:
+        ids = []
+        for name in names:
+            ids.extend(self.files.get(name, {}).get("chunk_ids", []))
+        return ids
+
+    def record(self, name: str, sha256: str, chunk_ids: List[str]) -> None:
+        self.files[name] = {"sha256": sha256, "chunk_ids": chunk_ids}
+
+    def forget(self, name: str) -> None:
+        self.files.pop(name, None)
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when both the running slots and the wait queue are full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class InferenceSlot:
+    """An admitted request: wait() blocks for a free concurrency slot, release() is idempotent."""
+
+    def __init__(self, queue: "InferenceQueue"):
+        self._queue = queue
+        self._lock = threading.Lock()
+        self._enqueued_at = time.perf_counter()
+        self._acquired = False
+        self._released = False
+
+    def wait(self) -> None:
+        self._queue._semaphore.acquire()
+        with self._lock:
+            if self._released:
+                # Abandoned while waiting (e.g. client went away): give the slot back
+                self._queue._semaphore.release()
+                raise RuntimeError("Inference slot released before it was acquired")
+            self._acquired = True
+        self._queue._started(time.perf_counter() - self._enqueued_at)
+
+    def release(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+            acquired = self._acquired
+        self._queue._finished(acquired)
+        if acquired:
+            self._queue._semaphore.release()
+
+
+class InferenceQueue:
+    """
+    Runs blocking inference off the event loop with at most `max_concurrency`
+    jobs in flight and at most `max_queue` jobs waiting. Further requests are
+    rejected immediately with QueueFullError so callers can answer 429.
+    """
+
+    def __init__(self, max_concurrency: int = 1, max_queue: int = 8, retry_after: int = 10):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        self._semaphore = threading.Semaphore(self.max_concurrency)
+        # Waiting jobs block on the semaphore inside their own worker thread
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency + self.max_queue,
+            thread_name_prefix="inference"
+        )
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_ms = Histogram()
+
+    def admit(self) -> InferenceSlot:
+        with self._lock:
+            if self.waiting + self.running >= self.max_concurrency + self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(self.retry_after)
+            self.waiting += 1
+        return InferenceSlot(self)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        slot = self.admit()
+
+        def job():
+            try:
+                slot.wait()
+                return fn(*args, **kwargs)
+            finally:
+                slot.release()
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, job)
+
+    def _started(self, waited: float) -> None:
+        with self._lock:
+            self.waiting -= 1
+            self.running += 1
+        self.wait_ms.observe(waited * 1000)
+
+    def _finished(self, acquired: bool) -> None:
+        with self._lock:
+            if acquired:
+                self.running -= 1
+                self.completed += 1
+            else:
+                self.waiting -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_ms": self.wait_ms.stats(),
+        }
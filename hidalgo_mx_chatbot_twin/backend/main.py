@@ -1,14 +1,21 @@
 import os
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
 from typing import List, Optional
 import uvicorn
 import shutil
 import logging
+import threading
 import json # Added json import
+import csv
+import io
 from rag_engine import ChatbotBackend
 from rules_engine import RulesEngine
+from inference_queue import InferenceQueue, QueueFullError
+import settings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -27,13 +34,31 @@ app.add_middleware(
 
 # Global chatbot state
 chatbot_instance = None
-is_ready = False
+is_ready = False  # retrieval and generator loaded: /chat can answer
+retrieval_ready = False  # embeddings + index loaded: /search works, LLM may still be loading
 initialization_error = None
+indexing_in_progress = False
+initializing = False  # a ChatbotBackend is being built; uploads meanwhile wait in pending_uploads
+pending_uploads: List[str] = []
 UPLOAD_DIR = "uploaded_pdfs"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # ... (rest of setup)
-rules_engine = RulesEngine()
+rules_engine = RulesEngine(cache_size=settings.RULES_CACHE_SIZE)
+
+def on_rules_reloaded(version: int):
+    # Cached answers embed the previous rules' prioritized programs
+    if chatbot_instance is not None:
+        chatbot_instance.response_cache.invalidate()
+        logger.info(f"Response cache invalidated for rules version {version}")
+
+rules_engine.add_reload_listener(on_rules_reloaded)
+# Retrieval + generation run here, off the event loop, with bounded concurrency
+inference_queue = InferenceQueue(
+    max_concurrency=settings.INFERENCE_CONCURRENCY,
+    max_queue=settings.INFERENCE_QUEUE_SIZE,
+    retry_after=settings.INFERENCE_RETRY_AFTER
+)
 
 class UserContext(BaseModel):
     age: Optional[int] = None
@@ -47,16 +72,46 @@ class UserContext(BaseModel):
     
 class ChatRequest(BaseModel):
     message: str
-    model_name: str = "phi-2" # Options: "phi-2", "socialite-llama"
+    model_name: str = "phi-2" # Options: "phi-2", "socialite-llama" (and their "-int8" CPU-quantized variants)
     user_context: Optional[UserContext] = None
     is_advisor: bool = False
 
 class ChatResponse(BaseModel):
     response: str
     source_documents: Optional[List[str]] = []
+    cached: bool = False
+
+class SearchRequest(BaseModel):
+    query: str
+    k: int = Field(4, ge=1, le=settings.SEARCH_MAX_K)
+    is_advisor: bool = False
+
+class SearchResult(BaseModel):
+    content: str
+    source: Optional[str] = None
+    heading: Optional[str] = None  # e.g. "TÍTULO I - ... > CAPÍTULO II - ... > Artículo 5"
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult] = []
+
+def start_initialization():
+    """Build the chatbot in background. Callers check `initializing` first: only one build may run."""
+    global initializing, initialization_error
+    import asyncio
+    initializing = True
+    initialization_error = None
+    asyncio.create_task(initialize_chatbot())
+
+def ingest_pending_uploads():
+    """Hand uploads queued during initialization to the published chatbot."""
+    if pending_uploads:
+        import asyncio
+        file_paths = list(pending_uploads)
+        pending_uploads.clear()
+        asyncio.create_task(ingest_uploaded_files(file_paths))
 
 async def initialize_chatbot():
-    global chatbot_instance, is_ready, initialization_error
+    global chatbot_instance, is_ready, retrieval_ready, initialization_error, initializing
     try:
         from pathlib import Path
         existing_files = [str(p) for p in Path(UPLOAD_DIR).rglob("*.pdf")]
@@ -67,7 +122,17 @@ async def initialize_chatbot():
             import concurrent.futures
             loop = asyncio.get_event_loop()
             with concurrent.futures.ThreadPoolExecutor() as pool:
-                chatbot_instance = await loop.run_in_executor(pool, lambda: ChatbotBackend(existing_files))
+                # 1. Retrieval first (embeddings + FAISS index): /search works from here on
+                instance = await loop.run_in_executor(pool, lambda: ChatbotBackend(existing_files, load_generator=False))
+                chatbot_instance = instance
+                retrieval_ready = True
+                # Pick up index changes saved by other worker processes
+                instance.start_watching(settings.INDEX_RELOAD_INTERVAL)
+                # Files uploaded while the index was being built (already indexed ones are skipped)
+                ingest_pending_uploads()
+                logger.info("Retrieval ready. Loading language model...")
+                # 2. Generator, loaded independently of the index
+                await loop.run_in_executor(pool, instance.initialize_generation)
             
             is_ready = True
             logger.info("\n" + "="*50 + "\n¡ASISTENTE VIRTUAL LISTO PARA PREGUNTAS!\n" + "="*50)
@@ -78,13 +143,35 @@ async def initialize_chatbot():
         initialization_error = str(e)
         is_ready = False
         logger.error(f"Error al inicializar el chatbot: {e}")
+    finally:
+        initializing = False
+        if chatbot_instance is None and pending_uploads:
+            # Uploads arrived after this build listed the upload directory (or the build failed):
+            # build again, which picks them up from disk
+            pending_uploads.clear()
+            is_ready = False
+            start_initialization()
+
+async def ingest_uploaded_files(file_paths: List[str]):
+    """Index freshly uploaded PDFs into the live chatbot without taking it offline."""
+    global indexing_in_progress
+    import asyncio
+    indexing_in_progress = True
+    try:
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, chatbot_instance.ingest_files, file_paths)
+    except Exception as e:
+        logger.error(f"Error en la indexación incremental: {e}", exc_info=True)
+    finally:
+        indexing_in_progress = False
 
 @app.on_event("startup")
 async def startup_event():
-    import asyncio
     logger.info("Server starting up...")
+    # Pick up edits to priority_rules.json without a restart
+    rules_engine.start_watching(settings.RULES_RELOAD_INTERVAL)
     # Fire and forget initialization
-    asyncio.create_task(initialize_chatbot())
+    start_initialization()
 
 @app.post("/upload")
 async def upload_files(files: List[UploadFile] = File(...)):
@@ -98,74 +185,261 @@ async def upload_files(files: List[UploadFile] = File(...)):
                 shutil.copyfileobj(file.file, buffer)
             saved_files.append(file_path)
         
-        # Trigger re-initialization in background
         import asyncio
-        is_ready = False
-        asyncio.create_task(initialize_chatbot())
+        if chatbot_instance is not None:
+            # Add only the new files to the live index; chat keeps being served meanwhile
+            asyncio.create_task(ingest_uploaded_files(saved_files))
+        elif initializing:
+            # A build is already running; a second ChatbotBackend would sync the same
+            # faiss_index/ concurrently. Index these once the running one is published.
+            pending_uploads.extend(saved_files)
+        else:
+            # Nothing loaded yet: build the chatbot from scratch in background
+            is_ready = False
+            start_initialization()
         
         return {"message": "Files uploaded. Optimization and indexing started in background.", "filenames": [f.filename for f in files]}
     except Exception as e:
         logger.error(f"Error calling upload: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    global chatbot_instance, is_ready
-    
+def check_chat_available():
+    if not is_ready and initialization_error:
+         # A failed build or generator load is not retried automatically: report it instead of "loading"
+         raise HTTPException(status_code=503, detail=f"El asistente no pudo inicializarse: {initialization_error}")
+
+    if not is_ready and retrieval_ready:
+         raise HTTPException(status_code=503, detail="Los documentos ya están indexados, pero el modelo de lenguaje aún se está cargando. Por favor, espera un momento y vuelve a intentarlo.")
+
     if not is_ready:
          raise HTTPException(status_code=503, detail="El sistema se está inicializando (procesando 94 PDFs). Por favor, espera un momento y vuelve a intentarlo.")
     
     if not chatbot_instance:
          raise HTTPException(status_code=400, detail="No hay documentos cargados. Por favor sube PDFs primero.")
+
+def prioritize(request: ChatRequest):
+    """Run the rules engine for the request. Returns (prioritized_programs, user_info)."""
+    prioritized_programs = []
+    if request.user_context:
+        context_dict = request.user_context.dict(exclude_none=True)
+        prioritized_programs = rules_engine.evaluate(context_dict)
+        if prioritized_programs:
+            logger.info(f"Prioritized Programs for user: {prioritized_programs}")
+
+    user_info = request.user_context.dict(exclude_none=True) if request.user_context else {}
+    return prioritized_programs, user_info
+
+def queue_full_error(e: QueueFullError) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="El asistente está atendiendo muchas consultas en este momento. Por favor, intenta de nuevo en unos segundos.",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest, http_response: Response):
+    check_chat_available()
     
     try:
         # 1. Evaluate Priorities
-        prioritized_programs = []
-        if request.user_context:
-            context_dict = request.user_context.dict(exclude_none=True)
-            prioritized_programs = rules_engine.evaluate(context_dict)
-            if prioritized_programs:
-                logger.info(f"Prioritized Programs for user: {prioritized_programs}")
-
-        # 2. Generate Response with Context
-        user_info = request.user_context.dict(exclude_none=True) if request.user_context else {}
-        response = chatbot_instance.answer_question(
+        prioritized_programs, user_info = prioritize(request)
+
+        # 2. Generate Response with Context (in the inference executor)
+        response, cached = await inference_queue.run(
+            chatbot_instance.answer_with_cache_status,
             request.message, 
             model_name=request.model_name,
             prioritized_programs=prioritized_programs,
             is_advisor=request.is_advisor,
             user_info=user_info
         )
-        return ChatResponse(response=response)
+        http_response.headers["X-Cache"] = "HIT" if cached else "MISS"
+        return ChatResponse(response=response, cached=cached)
+    except QueueFullError as e:
+        raise queue_full_error(e)
     except Exception as e:
         logger.error(f"CRITICAL ERROR in chat endpoint: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming variant of /chat as NDJSON: one {"token": ...} line per generated
+    piece of text and a final {"done": true, "ttft_ms": ..., "total_ms": ...} line.
+    """
+    check_chat_available()
+
+    try:
+        prioritized_programs, user_info = prioritize(request)
+    except Exception as e:
+        logger.error(f"CRITICAL ERROR in chat stream endpoint: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+    try:
+        slot = inference_queue.admit()
+    except QueueFullError as e:
+        raise queue_full_error(e)
+
+    cancel = threading.Event()
+
+    def events():
+        stream = None
+        try:
+            slot.wait()
+            stream = chatbot_instance.stream_answer(
+                request.message,
+                model_name=request.model_name,
+                prioritized_programs=prioritized_programs,
+                is_advisor=request.is_advisor,
+                user_info=user_info,
+                cancel=cancel
+            )
+            for event in stream:
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"CRITICAL ERROR while streaming: {str(e)}", exc_info=True)
+            yield json.dumps({"error": f"Error interno del servidor: {str(e)}", "done": True}, ensure_ascii=False) + "\n"
+        finally:
+            # Closing the stream waits for the generation thread, so the slot is
+            # only freed once the model has actually stopped
+            if stream is not None:
+                stream.close()
+            slot.release()
+
+    body = events()
+
+    def stop_stream():
+        # Runs after the response ends, including when the client disconnected mid-stream:
+        # stop generation at the next token, wait for it, then free the slot (a no-op if
+        # events() already did). Sync, so Starlette runs it in its threadpool.
+        cancel.set()
+        body.close()
+        slot.release()
+
+    # Sync generator: Starlette iterates it in its threadpool, off the event loop.
+    return StreamingResponse(body, media_type="application/x-ndjson", background=BackgroundTask(stop_stream))
+
+@app.post("/search", response_model=SearchResponse)
+async def search(request: SearchRequest):
+    """Retrieval only: usable as soon as the index is loaded, even while the LLM is loading."""
+    if not retrieval_ready or not chatbot_instance:
+         raise HTTPException(status_code=503, detail="El índice de documentos aún no está listo.")
+
+    import asyncio
+    loop = asyncio.get_event_loop()
+    docs = await loop.run_in_executor(None, lambda: chatbot_instance.search(request.query, is_advisor=request.is_advisor, k=request.k))
+    return SearchResponse(results=[
+        SearchResult(
+            content=d.page_content,
+            source=d.metadata.get("source"),
+            heading=" > ".join(d.metadata[f] for f in ("titulo", "capitulo", "seccion", "articulo") if d.metadata.get(f)) or None
+        ) for d in docs
+    ])
+
 @app.get("/health")
 def health_check():
+    if is_ready:
+        status, message = "healthy", "Chatbot ready"
+    elif initialization_error:
+        status = "error" if not retrieval_ready else "retrieval_only"
+        message = f"Initialization failed: {initialization_error}"
+    elif retrieval_ready:
+        status, message = "retrieval_only", "Document search ready; language model is still loading..."
+    else:
+        status, message = "initializing", "Chatbot is processing documents in background..."
     return {
-        "status": "healthy" if is_ready else "initializing",
+        "status": status,
         "ready": is_ready,
+        "retrieval_ready": retrieval_ready,
         "error": initialization_error,
-        "message": "Chatbot ready" if is_ready else "Chatbot is processing documents in background..."
+        "indexing": indexing_in_progress,
+        "message": message
     }
 
-@app.post("/verify-key")
-async def verify_key(key: str = Body(..., embed=True)):
+@app.get("/metrics")
+def metrics():
+    stats = chatbot_instance.metrics() if chatbot_instance else {}
+    stats["inference_queue"] = inference_queue.stats()
+    stats["rules"] = {"version": rules_engine.version, "count": len(rules_engine.rules), "cache": rules_engine.cache.stats()}
+    return stats
+
+def is_advisor_key(key: str) -> bool:
     try:
         with open("advisor_keys.json", "r") as f:
             data = json.load(f)
             valid_keys = data.get("keys", [])
-            
-        if key in valid_keys:
-            logger.info("Advisor key verified successfully.")
-            return {"valid": True}
-        else:
-            logger.warning("Invalid advisor key attempt.")
-            return {"valid": False}
+        return key in valid_keys
     except Exception as e:
         logger.error(f"Error verifying key: {e}")
+        return False
+
+@app.post("/verify-key")
+async def verify_key(key: str = Body(..., embed=True)):
+    if is_advisor_key(key):
+        logger.info("Advisor key verified successfully.")
+        return {"valid": True}
+    else:
+        logger.warning("Invalid advisor key attempt.")
         return {"valid": False}
+
+def parse_roster(filename: str, content: bytes) -> List[dict]:
+    """Rows of a CSV or JSON (array of objects) roster, coerced like /chat's user_context."""
+    text = content.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError("El JSON debe ser una lista de objetos.")
+    else:
+        # Empty CSV cells mean "not provided", like an omitted field
+        rows = [{k: v for k, v in row.items() if k and v not in ("", None)} for row in csv.DictReader(io.StringIO(text))]
+    contexts = []
+    for i, row in enumerate(rows, start=1):
+        try:
+            contexts.append(UserContext(**row).dict(exclude_none=True))
+        except Exception as e:
+            raise ValueError(f"fila {i}: {e}")
+    return contexts
+
+@app.post("/rules/evaluate-batch")
+async def evaluate_batch(key: str = Form(...), file: UploadFile = File(...)):
+    """
+    Eligibility for a whole roster (CSV with UserContext columns, or a JSON array).
+    Streams NDJSON: one {"row": i, "prioritized_programs": [...]} line per row, in input order.
+    """
+    if not is_advisor_key(key):
+        raise HTTPException(status_code=403, detail="Clave de asesor inválida.")
+    content = await file.read()
+    import asyncio
+    loop = asyncio.get_event_loop()
+    try:
+        # CSV parsing and pydantic coercion of every row: off the event loop
+        rows = await loop.run_in_executor(None, parse_roster, file.filename or "", content)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"No se pudo leer el archivo: {e}")
+    logger.info(f"Batch rule evaluation: {len(rows)} rows (rules version {rules_engine.version})")
+
+    def results():
+        for start in range(0, len(rows), settings.BATCH_EVAL_ROWS):
+            batch = rules_engine.evaluate_batch(rows[start:start + settings.BATCH_EVAL_ROWS])
+            for offset, programs in enumerate(batch):
+                yield json.dumps({"row": start + offset, "prioritized_programs": programs}, ensure_ascii=False) + "\n"
+
+    # Sync generator: evaluated in Starlette's threadpool, chunk by chunk, off the event loop
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.post("/rules/reload")
+async def reload_rules(key: str = Body(..., embed=True)):
+    """Re-read priority_rules.json now (advisor key required). A bad file leaves the active rules in place."""
+    if not is_advisor_key(key):
+        raise HTTPException(status_code=403, detail="Clave de asesor inválida.")
+    import asyncio
+    loop = asyncio.get_event_loop()
+    try:
+        version = await loop.run_in_executor(None, rules_engine.reload)
+    except Exception as e:
+        logger.error(f"Rules reload rejected, keeping version {rules_engine.version}: {e}")
+        raise HTTPException(status_code=422, detail=f"Reglas no válidas; se mantienen las actuales (versión {rules_engine.version}): {e}")
+    return {"version": version, "rules": len(rules_engine.rules)}
         
 # Run the application
 if __name__ == "__main__":
@@ -0,0 +1,207 @@
+import gc
+import itertools
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import torch
+from transformers import AutoModelForCausalLM
+import settings
+
+logger = logging.getLogger(__name__)
+
+# Friendly model names accepted by /chat mapped to their HuggingFace checkpoints.
+# "quantize": "int8" loads the generator with dynamic int8 quantization on CPU.
+MODEL_SPECS: Dict[str, Dict[str, Any]] = {
+    "phi-2": {"hf_id": "TinyLlama/TinyLlama-1.1B-Chat-v1.0"},  # Valid 4GB VRAM alternative
+    "phi-2-int8": {"hf_id": "TinyLlama/TinyLlama-1.1B-Chat-v1.0", "quantize": "int8"},
+    "socialite-llama": {"hf_id": "hlab/SocialiteLlama"},
+    "socialite-llama-int8": {"hf_id": "hlab/SocialiteLlama", "quantize": "int8"},
+}
+DEFAULT_MODEL = "phi-2"
+
+
+def model_spec(name: str) -> Dict[str, Any]:
+    # Unknown names are treated as HuggingFace ids, as before
+    spec = dict(MODEL_SPECS.get(name, {"hf_id": name}))
+    if name in settings.QUANTIZED_MODELS:
+        spec["quantize"] = "int8"
+    return spec
+
+
+def load_causal_lm(hf_id: str, quantize: Optional[str] = None):
+    """
+    Load a causal LM for CPU inference. quantize="int8" applies dynamic int8
+    quantization to every nn.Linear (weights stored int8, activations quantized
+    on the fly), roughly quartering the memory of the linear layers.
+    """
+    model = AutoModelForCausalLM.from_pretrained(hf_id, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+    model.eval()
+    if quantize == "int8":
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif quantize:
+        raise ValueError(f"Unsupported quantization mode: {quantize}")
+    return model
+
+
+def model_size_bytes(model) -> int:
+    """
+    Bytes held by a model's weights. Dynamically quantized Linear layers keep their
+    int8 weight and bias packed in _packed_params, which parameters() does not list
+    and state_dict() only exposes as an opaque tuple, so they are unpacked here.
+    """
+    total = sum(t.numel() * t.element_size() for t in itertools.chain(model.parameters(), model.buffers()))
+    for module in model.modules():
+        # torch.ao.nn.quantized(.dynamic).Linear: weight()/bias() are methods returning the unpacked tensors
+        if callable(getattr(module, "weight", None)):
+            for t in (module.weight(), module.bias()):
+                if t is not None:
+                    total += t.numel() * t.element_size()
+    return total
+
+
+class GeneratorModel:
+    """A loaded generator: tokenizer, text-generation pipeline and the chain/batcher built on it."""
+
+    def __init__(self, name: str, hf_id: str, tokenizer, pipe, rag_chain, batcher=None):
+        self.name = name
+        self.hf_id = hf_id
+        self.tokenizer = tokenizer
+        self.pipe = pipe
+        self.rag_chain = rag_chain
+        self.batcher = batcher
+        try:
+            self.size_bytes = model_size_bytes(pipe.model)
+        except Exception:
+            self.size_bytes = 0
+        # Requests currently using this generator; an evicted generator is closed when the last one ends
+        self._leases = 0
+        self._retired = False
+        self._lease_lock = threading.Lock()
+
+    def acquire(self) -> "GeneratorModel":
+        with self._lease_lock:
+            self._leases += 1
+        return self
+
+    def release(self) -> None:
+        with self._lease_lock:
+            self._leases -= 1
+            close = self._retired and self._leases == 0
+        if close:
+            self.close()
+
+    def retire(self) -> None:
+        """Close now if no request holds this generator, otherwise when the last lease is released."""
+        with self._lease_lock:
+            self._retired = True
+            close = self._leases == 0
+        if close:
+            self.close()
+
+    def close(self) -> None:
+        if self.batcher:
+            self.batcher.close()
+            self.batcher = None
+
+
+class ModelRegistry:
+    """
+    Keeps up to `max_models` generators resident, evicting the least recently
+    used one when the count or `memory_budget_mb` (0 = unlimited) is exceeded.
+    A model that is already loaded is returned by a dictionary lookup; loading
+    happens outside the registry lock so other models keep serving meanwhile.
+    Requests hold a lease() on their generator so eviction never closes it
+    under them.
+    """
+
+    def __init__(self, loader: Callable[[str], GeneratorModel], max_models: int = 2, memory_budget_mb: int = 0):
+        self._loader = loader
+        self.max_models = max(1, max_models)
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self._models = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, name: str, lease: bool = False) -> GeneratorModel:
+        """Return the generator, loading it on a miss. With lease=True the caller must release() it."""
+        with self._lock:
+            model = self._models.get(name)
+            if model is not None:
+                self._models.move_to_end(name)
+                return model.acquire() if lease else model
+            load_lock = self._loading.setdefault(name, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                model = self._models.get(name)
+                if model is not None:
+                    self._models.move_to_end(name)
+                    return model.acquire() if lease else model
+            logger.info(f"Loading generator '{name}' into the model pool...")
+            model = self._loader(name)
+            with self._lock:
+                self._models[name] = model
+                if lease:
+                    model.acquire()
+                self.loads += 1
+                evicted = self._evict_over_limits(keep=name)
+                self._loading.pop(name, None)
+
+        for old in evicted:
+            logger.info(f"Evicting generator '{old.name}' from the model pool.")
+            old.retire()
+        if evicted:
+            # Drop our references so the evicted weights can actually be freed
+            evicted.clear()
+            del old
+            gc.collect()
+        return model
+
+    @contextmanager
+    def lease(self, name: str) -> Iterator[GeneratorModel]:
+        """Hold a generator for one request; if it is evicted meanwhile it is closed only on exit."""
+        model = self.get(name, lease=True)
+        try:
+            yield model
+        finally:
+            model.release()
+
+    def _evict_over_limits(self, keep: str) -> List[GeneratorModel]:
+        evicted = []
+
+        def over_limits() -> bool:
+            if len(self._models) > self.max_models:
+                return True
+            return bool(self.memory_budget) and sum(m.size_bytes for m in self._models.values()) > self.memory_budget
+
+        while len(self._models) > 1 and over_limits():
+            name = next(iter(self._models))
+            if name == keep:
+                break
+            evicted.append(self._models.pop(name))
+            self.evictions += 1
+        return evicted
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._models)
+
+    def snapshot(self) -> Dict[str, GeneratorModel]:
+        """Currently resident generators, without touching LRU order."""
+        with self._lock:
+            return dict(self._models)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {name: round(m.size_bytes / 1024 ** 2, 1) for name, m in self._models.items()}
+        return {
+            "loaded_mb": models,
+            "max_models": self.max_models,
+            "memory_budget_mb": self.memory_budget // (1024 * 1024),
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,244 @@
+import re
+import sys
+import time
+import queue
+import pickle
+import logging
+import threading
+import subprocess
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Iterator, NamedTuple, Optional, Set, Tuple
+from pdfminer.high_level import extract_text
+
+logger = logging.getLogger(__name__)
+
+# Extraction workers run this file as a script (see _serve at the bottom): a fresh
+# interpreter that imports only this module and pdfminer. multiprocessing's spawn
+# and forkserver children would also re-import the launching script (main.py, and
+# with it torch and the whole server), and fork would copy the running server.
+WORKER_COMMAND = [sys.executable, __file__]
+
+
+class ExtractionResult(NamedTuple):
+    pdf_path: Path
+    text: Optional[str]
+    elapsed: float
+    error: Optional[str]
+
+
+# Bump whenever clean_text changes so cached texts are re-extracted
+CLEAN_TEXT_VERSION = 1
+
+
+# clean_text passes, compiled once. Equivalent to running re.sub over the whole
+# text with r'http\S+', r'Página\s*\d+\s*de\s*\d+', r'^\s*$' (MULTILINE) and
+# r'\?' in turn, then collapsing r'\n\s*\n'; bench_clean_text.py checks that the
+# output stays identical to that reference.
+_URL_RE = re.compile(r'http\S+')
+_PAGE_RE = re.compile(r'Página\s*\d+\s*de\s*\d+')
+# r'^\s*$' split into anchored pieces: the multiline form is tried at every
+# offset and dominated the cost, these only start at a newline or the text start
+_TRAILING_BLANK_RE = re.compile(r'\n\s*\Z')
+_BLANK_RUN_RE = re.compile(r'\n\s*\n')
+_LEADING_BLANK_RE = re.compile(r'\A\s*$', re.MULTILINE)
+
+
+def clean_text(text: str) -> str:
+    if 'http' in text:
+        text = _URL_RE.sub('', text)
+    if 'Página' in text:
+        text = _PAGE_RE.sub('', text)
+    # Blank lines: whitespace after the last line break, between the first and
+    # last break of a run, and before the last break of a leading run
+    text = _TRAILING_BLANK_RE.sub('\n', text, count=1)
+    text = _BLANK_RUN_RE.sub('\n\n', text)
+    text = _LEADING_BLANK_RE.sub('', text, count=1)
+    text = text.replace('?', '')
+    return _BLANK_RUN_RE.sub('\n\n', text)
+
+
+# Structural headings of legal/program documents (ported from original_repo/backend.py)
+HEADING_PATTERNS = [
+    (re.compile(r'^\s*(T[ÍI]TULO\s+[IVXLCDM]+\s*[-–]\s+[^.,)\n]+)$', re.MULTILINE), 'titulo'),
+    (re.compile(r'^\s*(SECCI[ÓO]N\s+[IVXLCDM]+\s*[-–]?\s+.+?)\s*$', re.MULTILINE), 'seccion'),
+    (re.compile(r'^\s*(CAP[ÍI]TULO\s+(?:[IVXLCDM]+|ÚNICO)\s*[-–]?\s+.+?)\s*$', re.MULTILINE), 'capitulo'),
+    (re.compile(r'^\s*Art[íi]culo\s+\d+\s*$', re.MULTILINE), 'articulo'),
+]
+HEADING_FIELDS = ("titulo", "seccion", "capitulo", "articulo")
+# Headings closed by a new heading of each kind (Título > Capítulo > Sección > Artículo)
+CLOSES = {
+    "titulo": ("capitulo", "seccion", "articulo"),
+    "capitulo": ("seccion", "articulo"),
+    "seccion": ("articulo",),
+    "articulo": (),
+}
+
+
+def split_structure(text: str) -> List[Dict[str, str]]:
+    """
+    Split cleaned text on TÍTULO/SECCIÓN/CAPÍTULO/Artículo boundaries
+    (extraer_estructura_completa). Each item has "contenido" plus the headings
+    in force at that point; a heading clears those below it (a new chapter
+    clears the article). Unlike the original, no text is dropped: the preamble before the
+    first heading and any text under a heading before its first article are
+    kept as items of their own. Text without headings is returned whole.
+    """
+    positions = []
+    for regex, kind in HEADING_PATTERNS:
+        for m in regex.finditer(text):
+            positions.append((m.start(), kind, m.group().strip()))
+    positions.sort(key=lambda x: x[0])
+
+    headings = dict.fromkeys(HEADING_FIELDS, "")
+    items = []
+    preamble = text[:positions[0][0]].strip() if positions else text.strip()
+    if preamble:
+        items.append({**headings, "contenido": preamble})
+    for i, (start, kind, heading) in enumerate(positions):
+        end = positions[i + 1][0] if i + 1 < len(positions) else len(text)
+        content = text[start:end].strip()
+        headings[kind] = heading
+        for lower in CLOSES[kind]:
+            headings[lower] = ""
+        # A bare heading line only labels what follows; it is carried as metadata
+        if content and content != heading:
+            items.append({**headings, "contenido": content})
+    return items
+
+
+def extract_pdf_text(pdf_path: str) -> Tuple[Optional[str], float, Optional[str]]:
+    """Extract and clean the text of one PDF. Returns (text, seconds, error)."""
+    start = time.perf_counter()
+    try:
+        with open(pdf_path, 'rb') as file:
+            text = extract_text(file)
+        return clean_text(text), time.perf_counter() - start, None
+    except Exception as e:
+        return None, time.perf_counter() - start, str(e)
+
+
+class _Worker:
+    """A long-lived extraction process, fed one PDF path at a time over its stdin."""
+
+    def __init__(self, results: "queue.Queue[Tuple[_Worker, Optional[tuple]]]"):
+        self.process = subprocess.Popen(WORKER_COMMAND, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        # (file position, path, start time) of the PDF being extracted
+        self.job: Optional[Tuple[int, Path, float]] = None
+        reader = threading.Thread(target=self._read, args=(results,), name="pdf-extract-reader", daemon=True)
+        reader.start()
+
+    def _read(self, results: "queue.Queue") -> None:
+        # Results are posted to the shared queue so the caller can wait on all workers with a timeout
+        try:
+            while True:
+                results.put((self, pickle.load(self.process.stdout)))
+        except Exception:
+            # Worker exited (crashed or was killed)
+            results.put((self, None))
+
+    def submit(self, position: int, pdf_path: Path) -> None:
+        self.job = (position, pdf_path, time.monotonic())
+        pickle.dump(str(pdf_path), self.process.stdin)
+        self.process.stdin.flush()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.wait()
+
+    def close(self) -> None:
+        # Closing stdin ends the worker loop
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+
+def iter_extracted_texts(pdf_files: List[Path], workers: int = 1, timeout: Optional[float] = None) -> Iterator[ExtractionResult]:
+    """
+    Extract the given PDFs across a pool of up to `workers` worker processes, yielding
+    results in file order. Workers are started once and reused for every file; one is
+    replaced only when its PDF crashes it or runs longer than `timeout` seconds (counted
+    from when the file was handed to it), in which case that file yields a result with
+    `error` set and the remaining files carry on.
+    """
+    if workers <= 1:
+        for pdf_path in pdf_files:
+            yield ExtractionResult(pdf_path, *extract_pdf_text(str(pdf_path)))
+        return
+
+    results_queue: "queue.Queue[Tuple[_Worker, Optional[tuple]]]" = queue.Queue()
+    pending = deque(enumerate(pdf_files))
+    idle: List[_Worker] = []
+    busy: Set[_Worker] = set()
+    results: Dict[int, ExtractionResult] = {}
+    pool_size = min(workers, len(pdf_files))
+    next_position = 0
+    try:
+        while next_position < len(pdf_files):
+            while pending and len(busy) < pool_size:
+                worker = idle.pop() if idle else _Worker(results_queue)
+                position, pdf_path = pending.popleft()
+                try:
+                    worker.submit(position, pdf_path)
+                except OSError as e:
+                    worker.kill()
+                    results[position] = ExtractionResult(pdf_path, None, 0.0, f"worker unavailable: {e}")
+                    continue
+                busy.add(worker)
+
+            if busy:
+                wait_timeout = None
+                if timeout is not None:
+                    oldest = min(w.job[2] for w in busy)
+                    wait_timeout = max(0.0, oldest + timeout - time.monotonic())
+                try:
+                    worker, message = results_queue.get(timeout=wait_timeout)
+                except queue.Empty:
+                    worker, message = None, None
+                # Messages from workers already killed for a timeout are stale
+                if worker in busy:
+                    busy.discard(worker)
+                    position, pdf_path, started = worker.job
+                    if message is None:
+                        worker.kill()
+                        results[position] = ExtractionResult(pdf_path, None, time.monotonic() - started, f"worker exited with code {worker.process.returncode}")
+                    else:
+                        results[position] = ExtractionResult(pdf_path, *message)
+                        idle.append(worker)
+                if timeout is not None:
+                    now = time.monotonic()
+                    for overdue in [w for w in busy if now - w.job[2] >= timeout]:
+                        busy.discard(overdue)
+                        overdue.kill()
+                        position, pdf_path, started = overdue.job
+                        results[position] = ExtractionResult(pdf_path, None, now - started, f"timed out after {timeout}s")
+
+            while next_position in results:
+                yield results.pop(next_position)
+                next_position += 1
+    finally:
+        # Closed early or failed: don't leave workers behind
+        for worker in busy:
+            worker.kill()
+        for worker in idle:
+            worker.close()
+
+
+def _serve() -> None:
+    """Worker loop: read pickled PDF paths from stdin, write pickled (text, seconds, error) to stdout."""
+    requests, replies = sys.stdin.buffer, sys.stdout.buffer
+    # Stray prints (e.g. from pdfminer) must not corrupt the result stream
+    sys.stdout = sys.stderr
+    while True:
+        try:
+            pdf_path = pickle.load(requests)
+        except EOFError:
+            return
+        pickle.dump(extract_pdf_text(pdf_path), replies)
+        replies.flush()
+
+
+if __name__ == "__main__":
+    _serve()
@@ -1,51 +1,109 @@
 import os
-import re
 import logging
+import threading
+import time
+import uuid
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import torch
 import gc
 from dotenv import load_dotenv
-from pdfminer.high_level import extract_text
-from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_huggingface import HuggingFacePipeline
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from huggingface_hub import login
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
+from transformers import pipeline, AutoTokenizer, TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
+from index_manifest import IndexManifest, LOCK_FILE, MANIFEST_FILE, file_sha256
+from file_lock import file_lock
+from vector_index import PartitionedIndex, ACCESS_LEVELS, reciprocal_rank_fusion, searchable_partitions
+from index_factory import index_config
+from pdf_extraction import HEADING_FIELDS, ExtractionResult, clean_text, extract_pdf_text, iter_extracted_texts, split_structure
+from text_cache import TextCache
+from embedding_pipeline import EmbeddingPipeline
+from caches import CachedQueryEmbeddings, ResponseCache
+from context_packer import MIN_SPAN_TOKENS, pack_context
+from metrics import Histogram
+from batch_scheduler import BatchScheduler
+from model_registry import ModelRegistry, GeneratorModel, DEFAULT_MODEL, model_spec, load_causal_lm
+import settings
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL_NAME = "intfloat/multilingual-e5-small"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+# Bump whenever extraction/splitting changes so persisted indexes get re-chunked
+CHUNKER_VERSION = 3
+# Tokens the generator may produce; reserved out of the model's context window
+MAX_NEW_TOKENS = 256
+
+class CancelGeneration(StoppingCriteria):
+    """Stops generate() at the next token once `event` is set (e.g. the streaming client went away)."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+MODEL_UNAVAILABLE_MSG = "El modelo de IA no pudo cargarse debido a falta de memoria o un error técnico. Por favor, intenta usar un modelo más ligero (Phi-2) o reinicia el servidor."
+
 class ChatbotBackend:
-    def __init__(self, pdf_files: List[str]):
+    def __init__(self, pdf_files: List[str], load_generator: bool = True):
         """
-        Initialize chatbot with multiple PDF files
+        Initialize chatbot with multiple PDF files.
+        With load_generator=False only retrieval is brought up; call
+        initialize_generation() afterwards to load the LLM.
         """
         self.pdf_files = [Path(pdf) for pdf in pdf_files]
-        self.chunk_size = 500
+        self.chunk_size = CHUNK_SIZE
         self.processed_files = set()
+        self.manifest = None
         self.vector_store = None
         self.embedding_model = None
-        self.tokenizer = None
-        self.pipe = None
+        self.embedding_pipeline = None
+        self.models = None
         self.retriever = None
         self.prompt = None
-        self.rag_chain = None
-        self.current_model_name = "phi-2" # Default matched with frontend request
+        self.current_model_name = DEFAULT_MODEL # Default matched with frontend request
+        self.index_path = "faiss_index"
+        self.text_cache = TextCache(settings.TEXT_CACHE_DIR)
+        self.response_cache = ResponseCache(
+            max_size=settings.RESPONSE_CACHE_SIZE,
+            similarity_threshold=settings.RESPONSE_CACHE_SIMILARITY or None
+        )
+        self.ttft_histogram = Histogram()
+        # Guards reads/writes of the live FAISS index; ingestion holds it only
+        # while swapping in sub-indexes that were built outside the lock.
+        self._index_lock = threading.RLock()
+        # Serializes incremental ingestions (e.g. two concurrent uploads). Other
+        # worker processes are kept out by shared_index_lock(), always taken after it.
+        self._ingest_lock = threading.Lock()
+        # Manifest file this process last loaded or saved; another stamp on disk
+        # means another worker saved the index since
+        self._manifest_stamp = None
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        # Runs the BM25 lookup alongside the FAISS search of the same query
+        self._lexical_pool = ThreadPoolExecutor(max_workers=max(2, settings.INFERENCE_CONCURRENCY), thread_name_prefix="bm25")
 
         self.load_environment()
         
         # Create offload directory if it doesn't exist
         os.makedirs("offload", exist_ok=True)
         
-        self.initialize_components("TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+        self.initialize_retrieval()
+        if load_generator:
+            self.initialize_generation(DEFAULT_MODEL)
 
     def load_environment(self) -> None:
         load_dotenv()
@@ -65,142 +123,251 @@ class ChatbotBackend:
             gc.collect()
 
     def clean_text(self, text: str) -> str:
-        # Adapted cleaning logic
-        patterns = [
-            r'http\S+', r'Página\s*\d+\s*de\s*\d+', 
-            r'^\s*$', r'\?'
-        ]
-        for pattern in patterns:
-            text = re.sub(pattern, '', text, flags=re.MULTILINE)
-        return re.sub(r'\n\s*\n', '\n\n', text)
-
-    def extract_structure(self, pdf_path: Path) -> List[Dict[str, Any]]:
+        return clean_text(text)
+
+    def extract_structure(self, pdf_path: Path, cleaned_text: Optional[str] = None) -> List[Dict[str, Any]]:
+        if cleaned_text is None:
+            cleaned_text, _, error = extract_pdf_text(str(pdf_path))
+            if error:
+                logger.error(f"Error processing {pdf_path}: {error}")
+                return []
+        # One item per TÍTULO/SECCIÓN/CAPÍTULO/Artículo span, carrying the headings in force
+        items = split_structure(cleaned_text)
+        for item in items:
+            item["source_document"] = pdf_path.name
+        return items
+
+    @staticmethod
+    def access_level(pdf_path: Path) -> str:
+        is_restricted = "manual" in pdf_path.name.lower() or "operativo" in pdf_path.name.lower()
+        return "advisor" if is_restricted else "public"
+
+    def iter_cleaned_texts(self, pdf_files: List[Path], hashes: Optional[Dict[str, str]] = None) -> Iterator[ExtractionResult]:
+        """
+        Yield the cleaned text of each PDF in file order, served from the text
+        cache when possible; only cache misses go through pdfminer.
+        """
+        hashes = dict(hashes or {})
+        for pdf_path in pdf_files:
+            if pdf_path.name not in hashes:
+                try:
+                    hashes[pdf_path.name] = file_sha256(pdf_path)
+                except OSError as e:
+                    logger.error(f"Error hashing {pdf_path}: {e}")
+
+        misses = list(dict.fromkeys(p for p in pdf_files if hashes.get(p.name) not in self.text_cache))
+        if len(misses) < len(pdf_files):
+            logger.info(f"🗃️ Texto en caché para {len(pdf_files) - len(misses)}/{len(pdf_files)} documentos.")
+        # The extractor gets its own copy: it iterates lazily while misses are consumed below
+        pending = set(misses)
+        extracted = iter_extracted_texts(list(misses), workers=settings.PDF_EXTRACT_WORKERS, timeout=settings.PDF_EXTRACT_TIMEOUT)
+
         try:
-            with open(pdf_path, 'rb') as file:
-                text = extract_text(file)
-            cleaned_text = self.clean_text(text)
-            # Simplified chunking for now - can enhance with the regex logic from original if needed
-            return [{"contenido": cleaned_text, "source_document": pdf_path.name}]
-        except Exception as e:
-            logger.error(f"Error processing {pdf_path}: {e}")
-            return []
+            for pdf_path in pdf_files:
+                sha256 = hashes.get(pdf_path.name)
+                if pdf_path in pending:
+                    # Taken in file order, so each result belongs to this path even when an
+                    # earlier file with identical content has filled the cache meanwhile
+                    pending.discard(pdf_path)
+                    result = next(extracted)
+                    if result.text is not None and sha256 is not None:
+                        self.text_cache.put(sha256, result.text)
+                    yield result
+                    continue
+                text = self.text_cache.get(sha256) if sha256 is not None else None
+                if text is not None:
+                    yield ExtractionResult(pdf_path, text, 0.0, None)
+                else:
+                    # Cache entry vanished or was unreadable after the initial check
+                    yield ExtractionResult(pdf_path, *extract_pdf_text(str(pdf_path)))
+        finally:
+            extracted.close()
+
+    def process_documents(self, pdf_files: Optional[List[Path]] = None, hashes: Optional[Dict[str, str]] = None) -> List[Document]:
+        return [doc for docs in self.iter_documents(pdf_files, hashes) for doc in docs]
 
-    def process_documents(self) -> List[Document]:
-        documents = []
+    def iter_documents(self, pdf_files: Optional[List[Path]] = None, hashes: Optional[Dict[str, str]] = None) -> Iterator[List[Document]]:
+        """Yield the chunks of each PDF, one list per file, as soon as it is processed."""
+        total_chunks = 0
         text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=100,
-            separators=["\n\n", "\n", " ", ""]
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            separators=["\n\n", "\n", " ", ""],
+            # Offsets let the context packer merge overlapping/adjacent chunks
+            add_start_index=True
         )
         
-        total_files = len(self.pdf_files)
+        pdf_files = self.pdf_files if pdf_files is None else pdf_files
+        total_files = len(pdf_files)
         logger.info(f"⏳ INICIANDO PROCESAMIENTO DE {total_files} DOCUMENTOS...")
         
-        for i, pdf_path in enumerate(self.pdf_files):
+        start = time.perf_counter()
+        timings = []
+        for i, result in enumerate(self.iter_cleaned_texts(pdf_files, hashes)):
+            pdf_path = result.pdf_path
             # Log progress every 10 files or first/last
             if i % 10 == 0 or i == total_files - 1:
                 logger.info(f"📁 Progreso: {i+1}/{total_files} archivos procesados...")
             
-            with self.gpu_memory_management():
-                data = self.extract_structure(pdf_path)
-                for item in data:
-                    content = item["contenido"]
-                    if not content: continue
-                    
-                    # Determine access level
-                    is_restricted = "manual" in pdf_path.name.lower() or "operativo" in pdf_path.name.lower()
-                    access_level = "advisor" if is_restricted else "public"
-                    
-                    # Use robust splitter
-                    chunks = text_splitter.create_documents(
-                        [content], 
-                        metadatas=[{"source": item["source_document"], "access": access_level}]
-                    )
-                    documents.extend(chunks)
+            if result.error:
+                logger.error(f"Error processing {pdf_path} ({result.elapsed:.2f}s): {result.error}")
+                continue
+            if result.elapsed:
+                logger.info(f"📄 {pdf_path.name}: texto extraído en {result.elapsed:.2f}s")
+                timings.append((result.elapsed, pdf_path.name))
+
+            documents = []
+            data = self.extract_structure(pdf_path, result.text)
+            for section, item in enumerate(data):
+                content = item["contenido"]
+                if not content: continue
                 
-        logger.info(f"✅ Procesamiento completado. {len(documents)} fragmentos generados.")
-        return documents
+                # Determine access level
+                access_level = self.access_level(pdf_path)
+                
+                # Use robust splitter
+                chunks = text_splitter.create_documents(
+                    [content], 
+                    metadatas=[{
+                        "source": item["source_document"], "access": access_level, "section": section,
+                        **{field: item[field] for field in HEADING_FIELDS if item.get(field)}
+                    }]
+                )
+                documents.extend(chunks)
+            total_chunks += len(documents)
+            yield documents
+                
+        if timings:
+            slowest = ", ".join(f"{name} ({secs:.1f}s)" for secs, name in sorted(timings, reverse=True)[:3])
+            logger.info(f"⏱️ Extracción: {len(timings)} PDFs en {time.perf_counter() - start:.1f}s. Más lentos: {slowest}")
+        logger.info(f"✅ Procesamiento completado. {total_chunks} fragmentos generados.")
 
-    def initialize_components(self, model_name: str = "microsoft/phi-2") -> None:
+    def initialize_retrieval(self) -> None:
+        """Load the embedding model and the FAISS index. Independent of which generator is loaded."""
         try:
             with self.gpu_memory_management():
                 logger.info("Initializing Embeddings...")
-                self.embedding_model = HuggingFaceEmbeddings(
-                    model_name="intfloat/multilingual-e5-small",
-                    model_kwargs={'device': 'cpu'} 
+                if settings.TORCH_NUM_THREADS > 0:
+                    torch.set_num_threads(settings.TORCH_NUM_THREADS)
+                embedding_model = CachedQueryEmbeddings(
+                    HuggingFaceEmbeddings(
+                        model_name=EMBEDDING_MODEL_NAME,
+                        model_kwargs={'device': 'cpu'},
+                        encode_kwargs={'batch_size': settings.EMBED_BATCH_SIZE}
+                    ),
+                    max_size=settings.QUERY_CACHE_SIZE,
+                    ttl=settings.QUERY_CACHE_TTL
                 )
+                with self._ingest_lock, self._index_lock:
+                    self.embedding_model = embedding_model
+                    self.embedding_pipeline = EmbeddingPipeline(
+                        self.embedding_model,
+                        batch_size=settings.EMBED_INDEX_BATCH,
+                        queue_size=settings.EMBED_QUEUE_SIZE
+                    )
+                    self.vector_store = None
+                self.setup_rag_chain()
+                self.response_cache.invalidate()
+        except Exception as e:
+            logger.error(f"CRITICAL ERROR initializing retrieval: {e}")
+            raise # Re-raise to let the caller know it failed
 
-                logger.info(f"Initializing Model: {model_name}...")
-                self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-                
+    def initialize_generation(self, model_name: str = DEFAULT_MODEL) -> None:
+        """Create the generator pool and warm `model_name`. Never touches the index."""
+        try:
+            # All generators share the embedding model, vector store and prompt
+            if self.models is None:
+                self.models = ModelRegistry(
+                    self.load_generator,
+                    max_models=settings.MODEL_POOL_SIZE,
+                    memory_budget_mb=settings.MODEL_MEMORY_BUDGET_MB
+                )
+            self.models.get(model_name)
+            self.current_model_name = model_name
+        except Exception as e:
+            logger.error(f"CRITICAL ERROR initializing components for {model_name}: {e}")
+            raise # Re-raise to let the caller know it failed
+
+    @property
+    def retrieval_ready(self) -> bool:
+        return self.vector_store is not None and self.prompt is not None
+
+    @property
+    def generation_ready(self) -> bool:
+        return self.models is not None and bool(self.models.loaded())
+
+    def load_generator(self, model_name: str) -> GeneratorModel:
+        """Load tokenizer + text-generation pipeline for a friendly model name (ModelRegistry loader)."""
+        spec = model_spec(model_name)
+        hf_id = spec["hf_id"]
+        quantize = spec.get("quantize")
+        if quantize and torch.cuda.is_available():
+            logger.warning(f"Quantized mode is CPU-only; loading {hf_id} unquantized on GPU.")
+            quantize = None
+
+        with self.gpu_memory_management():
+            logger.info(f"Initializing Model: {hf_id}{f' ({quantize})' if quantize else ''}...")
+            tokenizer = AutoTokenizer.from_pretrained(hf_id)
+            generation_kwargs = dict(
+                max_new_tokens=MAX_NEW_TOKENS,
+                do_sample=True,
+                temperature=0.3,
+                return_full_text=False
+            )
+            
+            if quantize:
+                pipe = pipeline(
+                    "text-generation",
+                    model=load_causal_lm(hf_id, quantize),
+                    tokenizer=tokenizer,
+                    **generation_kwargs
+                )
+            else:
                 # Setup pipeline with memory-efficient settings
                 # Use float16 if possible to save VRAM/RAM
                 dtype = torch.float16 if torch.cuda.is_available() else torch.float32
                 
-                self.pipe = pipeline(
+                pipe = pipeline(
                     "text-generation",
-                    model=model_name,
+                    model=hf_id,
+                    tokenizer=tokenizer,
                     torch_dtype=dtype,
                     device_map="auto",
                     model_kwargs={"offload_folder": "offload"},
-                    max_new_tokens=256,
-                    do_sample=True,
-                    temperature=0.3,
-                    return_full_text=False
+                    **generation_kwargs
                 )
 
-                self.setup_rag_chain()
-                logger.info(f"Model {model_name} loaded successfully.")
-        except Exception as e:
-            logger.error(f"CRITICAL ERROR initializing components for {model_name}: {e}")
-            # Ensure attributes exist even if loading failed
-            self.pipe = None
-            self.rag_chain = None
-            raise # Re-raise to let the caller know it failed
-
-    def setup_rag_chain(self) -> None:
-        index_path = "faiss_index"
-        
-        # Try to load existing index if available
-        if os.path.exists(index_path):
-            logger.info("Loading existing FAISS index from disk...")
-            try:
-                self.vector_store = FAISS.load_local(
-                    index_path, 
-                    self.embedding_model,
-                    allow_dangerous_deserialization=True
+            # Chain expects 'context' to be passed in, not retrieved automatically
+            rag_chain = (
+                self.prompt
+                | HuggingFacePipeline(pipeline=pipe)
+                | StrOutputParser()
+            )
+            batcher = None
+            if settings.GENERATION_BATCH_SIZE > 1:
+                if settings.INFERENCE_CONCURRENCY < settings.GENERATION_BATCH_SIZE:
+                    logger.warning(
+                        f"GENERATION_BATCH_SIZE={settings.GENERATION_BATCH_SIZE} exceeds INFERENCE_CONCURRENCY="
+                        f"{settings.INFERENCE_CONCURRENCY}; batches cannot fill and each prompt waits the batch window."
+                    )
+                batcher = BatchScheduler(
+                    pipe,
+                    max_batch_size=settings.GENERATION_BATCH_SIZE,
+                    window_ms=settings.GENERATION_BATCH_WINDOW_MS
                 )
-                logger.info("FAISS index loaded successfully.")
-            except Exception as e:
-                logger.error(f"Error loading FAISS index: {e}")
-                self.vector_store = None
-
-        if not self.vector_store:
-            logger.info("📦 Creando nuevo índice (etapa de aprendizaje de fragmentos)...")
-            documents = self.process_documents()
-            if not documents:
-                logger.warning("No hay documentos para indexar.")
-                return
-
-            # Batch indexing to show progress
-            batch_size = 500
-            total_chunks = len(documents)
-            
-            # Initialize with first batch
-            first_batch = documents[:batch_size]
-            self.vector_store = FAISS.from_documents(first_batch, self.embedding_model)
-            logger.info(f"🧠 Indexando: {min(batch_size, total_chunks)}/{total_chunks} fragmentos...")
+            logger.info(f"Model {hf_id} loaded successfully.")
+            return GeneratorModel(model_name, hf_id, tokenizer, pipe, rag_chain, batcher)
 
-            # Add remaining documents in batches
-            for i in range(batch_size, total_chunks, batch_size):
-                batch = documents[i : i + batch_size]
-                self.vector_store.add_documents(batch)
-                logger.info(f"🧠 Indexando: {min(i + batch_size, total_chunks)}/{total_chunks} fragmentos...")
+    @staticmethod
+    def chunker_settings() -> Dict[str, Any]:
+        return {"version": CHUNKER_VERSION, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
 
-            # Save the index for next time
-            self.vector_store.save_local(index_path)
-            logger.info(f"💾 Índice guardado en disco: {index_path}")
+    @staticmethod
+    def index_settings() -> Dict[str, Any]:
+        # Query-time knobs (nprobe/efSearch) are left out: changing them needs no rebuild
+        return {"partitions": list(ACCESS_LEVELS), "index": index_config(), "docstore": "sqlite"}
 
+    def setup_rag_chain(self) -> None:
         # TinyLlama format
         template = """<|system|>
 Eres un asistente experto del Gobierno de Hidalgo. Responde usando el siguiente contexto.
@@ -216,45 +383,406 @@ Contexto:
             input_variables=["context", "question", "priority_instruction"],
             template=template
         )
-        
-        # Chain now expects 'context' to be passed in, not retrieved automatically
-        if self.pipe:
-            self.rag_chain = (
-                self.prompt
-                | HuggingFacePipeline(pipeline=self.pipe)
-                | StrOutputParser()
-            )
-        else:
-            logger.error("Cannot setup RAG chain: Model pipe is None.")
-            self.rag_chain = None
-
-    def reload_model_if_needed(self, new_model_name: str):
-        if new_model_name != self.current_model_name:
-            logger.info(f"Switching model from {self.current_model_name} to {new_model_name}...")
-            # Clear invalid model name mapping if needed, or mapping friendly names to HF IDs
-            hf_id = new_model_name
-            if new_model_name == "socialite-llama":
-                hf_id = "hlab/SocialiteLlama"
-            elif new_model_name == "phi-2":
-                hf_id = "TinyLlama/TinyLlama-1.1B-Chat-v1.0" # Valid 4GB VRAM alternative
-            
-            self.current_model_name = new_model_name
-            
-            # Clean up old model safely
-            self.pipe = None
-            self.tokenizer = None
-            with self.gpu_memory_management():
-                pass
-            
-            # Re-initialize
-            self.initialize_components(model_name=hf_id)
+
+        self.sync_index()
+        if not self.vector_store:
+            logger.warning("No hay documentos para indexar.")
+
+    def shared_index_lock(self):
+        """
+        Lock on faiss_index/ shared by every worker process. Held, after _ingest_lock,
+        while loading for a sync, syncing, ingesting and reloading, so one process at a
+        time changes the index files, manifest and chunks.sqlite3, and always on top
+        of the latest saved version.
+        """
+        return file_lock(os.path.join(self.index_path, LOCK_FILE))
+
+    def load_index(self) -> None:
+        """
+        Load the persisted index and its manifest, if the manifest matches the current
+        embeddings/chunker/index layout, and swap them in; otherwise start an empty
+        manifest. Callers hold _ingest_lock and shared_index_lock().
+        """
+        index_path = self.index_path
+        chunker = self.chunker_settings()
+        index_settings = self.index_settings()
+        stamp = IndexManifest.stamp(index_path)
+        manifest = IndexManifest.load(index_path)
+        vector_store = None
+        # index_path itself always exists by now (shared_index_lock() creates the lock file in it):
+        # look for a manifest or saved index, including the former single-store layout
+        saved = [MANIFEST_FILE, "index.faiss"] + [os.path.join(access, "index.faiss") for access in ACCESS_LEVELS]
+
+        if any(os.path.exists(os.path.join(index_path, name)) for name in saved):
+            if manifest is None or not manifest.is_compatible(EMBEDDING_MODEL_NAME, chunker, index_settings):
+                logger.warning("FAISS index has no compatible manifest (embedding model, chunker or index layout changed). Rebuilding...")
+            else:
+                logger.info("Loading existing FAISS index from disk...")
+                try:
+                    vector_store = PartitionedIndex.load(index_path, self.embedding_model)
+                    mapped = ", ".join(sorted(vector_store.mmapped)) or "none"
+                    logger.info(f"FAISS index loaded successfully ({vector_store.ntotal} vectors, memory-mapped: {mapped}).")
+                except Exception as e:
+                    logger.error(f"Error loading FAISS index: {e}")
+
+        if vector_store is None:
+            logger.info("📦 Creando nuevo índice (etapa de aprendizaje de fragmentos)...")
+            manifest = IndexManifest(EMBEDDING_MODEL_NAME, chunker, index_settings)
+        with self._index_lock:
+            self.vector_store = vector_store
+            self.manifest = manifest
+        self._manifest_stamp = stamp
+        self.processed_files = set(manifest.files)
+
+    def _reload_if_stale(self) -> bool:
+        # Callers hold _ingest_lock and shared_index_lock()
+        if IndexManifest.stamp(self.index_path) == self._manifest_stamp:
+            return False
+        logger.info("🔁 El índice en disco cambió (guardado por otro proceso); recargando...")
+        self.load_index()
+        # Cached answers were generated from the previous index contents
+        self.response_cache.invalidate()
+        return True
+
+    def reload_if_changed(self) -> bool:
+        """Reload the index if another worker process saved it since this one last loaded or saved it."""
+        if IndexManifest.stamp(self.index_path) == self._manifest_stamp:
+            return False
+        with self._ingest_lock, self.shared_index_lock():
+            return self._reload_if_stale()
+
+    def start_watching(self, interval: float) -> None:
+        """
+        Poll the manifest every `interval` seconds in a daemon thread and reload
+        the index when another worker has saved it (multi-worker deployments).
+        """
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def watch() -> None:
+            while not self._stop_watching.wait(interval):
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    logger.error(f"Error reloading the index saved by another worker: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="index-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop_watching.set()
+
+    def sync_index(self) -> None:
+        """
+        Load the persisted index and bring it in line with self.pdf_files using the
+        manifest: vectors of unchanged files are reused, changed or new files are
+        re-embedded and vectors of deleted files are dropped. With several workers
+        starting together, the first one syncs and the others then load its result.
+        """
+        with self._ingest_lock, self.shared_index_lock():
+            self.load_index()
+            orphan_ids = self._check_manifest_consistency()
+            changed, deleted, hashes = self.manifest.diff(self.pdf_files)
+            if not changed and not deleted and not orphan_ids:
+                logger.info(f"♻️ Índice al día: {len(hashes)} documentos reutilizados sin re-indexar.")
+            else:
+                logger.info(f"🔄 Sincronizando índice: {len(changed)} nuevos/modificados, {len(deleted)} eliminados, {len(hashes) - len(changed)} sin cambios.")
+                self._replace_files(changed, deleted, hashes, extra_ids=orphan_ids)
+            self.processed_files = set(self.manifest.files)
+
+    def ingest_files(self, pdf_files: List[str]) -> int:
+        """
+        Incrementally index new or replaced PDFs into the live vector store.
+        Files whose content hash is already in the manifest are skipped.
+        Chunks are embedded, and the changed sub-indexes rebuilt, outside the
+        index lock so chat keeps being served from the current index; the lock
+        is only held to swap the new sub-indexes in. Saving to disk follows,
+        also without the index lock.
+        Returns the number of chunks added.
+        """
+        paths = [Path(pdf) for pdf in pdf_files]
+        with self._ingest_lock, self.shared_index_lock():
+            # Start from the latest saved index, so another worker's additions are kept
+            self._reload_if_stale()
+            start = time.perf_counter()
+            changed, hashes = self.manifest.changed_files(paths)
+            logger.info(f"➕ Indexación incremental: {len(changed)} de {len(paths)} documentos nuevos o modificados...")
+            added = self._replace_files(changed, [], hashes) if changed else 0
+
+            known = set(self.pdf_files)
+            self.pdf_files.extend(p for p in paths if p not in known)
+            self.processed_files = set(self.manifest.files)
+            logger.info(f"✅ Indexación incremental completada: {added} fragmentos en {time.perf_counter() - start:.1f}s")
+            return added
+
+    def _check_manifest_consistency(self) -> List[str]:
+        """
+        Mark files whose recorded chunks are missing from the index as changed
+        (e.g. a crash between saving the index and the manifest) and return the
+        ids of stored chunks that no manifest entry owns.
+        """
+        if self.vector_store is None:
+            return []
+        stored_ids = self.vector_store.stored_ids()
+        owned_ids = set()
+        for name, entry in self.manifest.files.items():
+            chunk_ids = entry.get("chunk_ids", [])
+            if not stored_ids.issuperset(chunk_ids):
+                logger.warning(f"Manifest entry for {name} does not match the index; it will be re-indexed.")
+                entry["sha256"] = None
+            owned_ids.update(chunk_ids)
+        return list(stored_ids - owned_ids)
+
+    def _replace_files(self, paths: List[Path], deleted: List[str], hashes: Dict[str, str], extra_ids: Optional[List[str]] = None) -> int:
+        # Extraction/chunking and embedding overlap; nothing touches the live index yet
+        documents, text_embeddings = self.embedding_pipeline.run(self.iter_documents(paths, hashes))
+        ids = [str(uuid.uuid4()) for _ in documents]
+
+        # Only files that produced chunks are recorded; one whose extraction failed or
+        # timed out stays out of the manifest so the next startup or upload retries it
+        ids_by_source: Dict[str, List[str]] = {}
+        for doc_id, doc in zip(ids, documents):
+            ids_by_source.setdefault(doc.metadata["source"], []).append(doc_id)
+        failed = [p.name for p in paths if p.name not in ids_by_source]
+        if failed:
+            logger.warning(f"⚠️ Sin fragmentos para {len(failed)} documento(s), se reintentarán: {', '.join(failed)}")
+
+        stale = deleted + [p.name for p in paths if p.name in self.manifest.files]
+        stale_ids = self.manifest.chunk_ids(stale) + list(extra_ids or [])
+        # Deletions and additions are built on copies of the affected sub-indexes (heap
+        # copies of memory-mapped ones, IVF/HNSW rebuilds, training); chat keeps searching
+        # the current ones. _ingest_lock keeps other writers out meanwhile.
+        vector_store = self.vector_store
+        if vector_store is None and text_embeddings:
+            vector_store = PartitionedIndex.create(self.index_path, self.embedding_model)
+        update = None
+        if vector_store is not None and (stale_ids or text_embeddings):
+            update = vector_store.prepare_update(stale_ids, text_embeddings, [d.metadata for d in documents], ids)
+
+        with self._index_lock:
+            if update is not None:
+                # Each chunk goes to the sub-index of its access level
+                vector_store.apply(update)
+                self.vector_store = vector_store
+        if update is not None and update.removed_ids:
+            logger.info(f"🗑️ Eliminados {len(update.removed_ids)} fragmentos obsoletos")
+        # Cached answers were generated from the previous index contents
+        self.response_cache.invalidate()
+
+        for name in stale:
+            self.manifest.forget(name)
+        for name, chunk_ids in ids_by_source.items():
+            self.manifest.record(name, hashes[name], chunk_ids)
+        self.save_index()
+        return len(documents)
+
+    def save_index(self) -> None:
+        """
+        Persist the index and manifest. Runs without the index lock: writing only
+        reads the live index, and callers hold _ingest_lock (and shared_index_lock()),
+        so nothing changes it meanwhile. The manifest is written last; other workers
+        reload once it changes.
+        """
+        if self.vector_store is not None:
+            self.vector_store.save(self.index_path)
+        self.manifest.save(self.index_path)
+        self._manifest_stamp = IndexManifest.stamp(self.index_path)
+        logger.info(f"💾 Índice guardado en disco: {self.index_path}")
+
+    def metrics(self) -> Dict[str, Any]:
+        stats = {}
+        if isinstance(self.embedding_model, CachedQueryEmbeddings):
+            stats["query_embedding_cache"] = self.embedding_model.cache.stats()
+        stats["response_cache"] = self.response_cache.stats()
+        stats["stream_ttft_ms"] = self.ttft_histogram.stats()
+        if self.models:
+            stats["model_pool"] = self.models.stats()
+            for name, generator in self.models.snapshot().items():
+                if generator.batcher:
+                    stats.setdefault("generation_batches", {})[name] = generator.batcher.stats()
+        return stats
+
+    @contextmanager
+    def generator_lease(self, model_name: str) -> Iterator[Optional[GeneratorModel]]:
+        """
+        Per-request model selection: a pool lookup, loading (and evicting) only on a miss.
+        Yields None if the model cannot be loaded. The generator stays open until the
+        block exits even if another request evicts it from the pool meanwhile.
+        """
+        try:
+            generator = self.models.get(model_name, lease=True)
+        except Exception as e:
+            logger.error(f"Error loading model {model_name}: {e}")
+            yield None
+            return
+        self.current_model_name = model_name
+        try:
+            yield generator
+        finally:
+            generator.release()
+
+    def _lookup_cache(self, question: str, model_name: str, is_advisor: bool, prioritized_programs: List[str], user_info: Dict[str, Any]) -> Tuple[int, List[float], Tuple, Optional[str]]:
+        """
+        Response cache lookup shared by the blocking and streaming paths. Returns the
+        cache generation, query embedding and partition to store a fresh answer under,
+        and the cached answer (None on a miss).
+        """
+        # Taken before retrieval: an invalidation from here on makes this answer stale
+        cache_generation = self.response_cache.generation
+        # Embed once: used for the semantic cache lookup and for retrieval.
+        # Repeated questions are answered from the query embedding cache.
+        query_embedding = self.embedding_model.embed_query(question)
+        cache_partition = ResponseCache.partition_key(model_name, is_advisor, prioritized_programs, user_info)
+        cached = self.response_cache.get(question, cache_partition, query_embedding)
+        return cache_generation, query_embedding, cache_partition, cached
 
     def answer_question(self, question: str, model_name: str = "phi-2", prioritized_programs: List[str] = [], is_advisor: bool = False, user_info: Dict[str, Any] = {}) -> str:
-        self.reload_model_if_needed(model_name)
-        
+        response, _ = self.answer_with_cache_status(question, model_name, prioritized_programs, is_advisor, user_info)
+        return response
+
+    def answer_with_cache_status(self, question: str, model_name: str = "phi-2", prioritized_programs: List[str] = [], is_advisor: bool = False, user_info: Dict[str, Any] = {}) -> Tuple[str, bool]:
+        """Same as answer_question, also reporting whether the answer came from the response cache."""
         if not self.vector_store:
-            return "El sistema no está listo. Por favor sube documentos primero."
-            
+            return "El sistema no está listo. Por favor sube documentos primero.", False
+
+        cache_generation, query_embedding, cache_partition, cached = self._lookup_cache(question, model_name, is_advisor, prioritized_programs, user_info)
+        if cached is not None:
+            logger.info("Response served from cache.")
+            return cached, True
+
+        with self.generator_lease(model_name) as generator:
+            if not generator:
+                return MODEL_UNAVAILABLE_MSG, False
+
+            inputs = self.build_chain_inputs(question, query_embedding, prioritized_programs, is_advisor, user_info, generator)
+
+            with self.gpu_memory_management():
+                try:
+                    response = self.generate(generator, inputs)
+                    clean_response = self.clean_response(response)
+                    self.response_cache.put(question, cache_partition, clean_response, query_embedding, cache_generation)
+                    return clean_response, False
+                except Exception as e:
+                    logger.error(f"Error during RAG chain invocation: {e}")
+                    return f"Error al generar respuesta: {str(e)}", False
+
+    def generate(self, generator: GeneratorModel, inputs: Dict[str, str]) -> str:
+        """Run the generator on the prompt variables, micro-batched with concurrent requests when enabled."""
+        if generator.batcher:
+            return generator.batcher.generate(self.prompt.format(**inputs))
+        return generator.rag_chain.invoke(inputs)
+
+    def stream_answer(self, question: str, model_name: str = "phi-2", prioritized_programs: List[str] = [], is_advisor: bool = False, user_info: Dict[str, Any] = {}, cancel: Optional[threading.Event] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of answer_question. Yields {"token": str} events as the
+        model produces text, then a final {"done": True, ...} event carrying
+        cache status, time-to-first-token and total time in milliseconds.
+        Setting `cancel`, or closing this iterator, stops generation at the next
+        token; the generation thread has always finished once the iterator is
+        exhausted or closed.
+        """
+        start = time.perf_counter()
+        cancel = cancel or threading.Event()
+
+        if not self.vector_store:
+            yield {"token": "El sistema no está listo. Por favor sube documentos primero."}
+            yield {"done": True, "cached": False, "ttft_ms": None, "total_ms": round((time.perf_counter() - start) * 1000, 1)}
+            return
+
+        cache_generation, query_embedding, cache_partition, cached = self._lookup_cache(question, model_name, is_advisor, prioritized_programs, user_info)
+        if cached is not None:
+            ttft_ms = round((time.perf_counter() - start) * 1000, 1)
+            yield {"token": cached}
+            yield {"done": True, "cached": True, "ttft_ms": ttft_ms, "total_ms": ttft_ms}
+            return
+
+        with self.generator_lease(model_name) as generator:
+            if not generator:
+                yield {"token": MODEL_UNAVAILABLE_MSG}
+                yield {"done": True, "cached": False, "ttft_ms": None, "total_ms": round((time.perf_counter() - start) * 1000, 1)}
+                return
+            inputs = self.build_chain_inputs(question, query_embedding, prioritized_programs, is_advisor, user_info, generator)
+            if cancel.is_set():
+                return
+
+            streamer = TextIteratorStreamer(generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
+            errors = []
+
+            def generate() -> None:
+                try:
+                    generator.pipe(self.prompt.format(**inputs), streamer=streamer, stopping_criteria=StoppingCriteriaList([CancelGeneration(cancel)]))
+                except Exception as e:
+                    errors.append(e)
+                    streamer.end()
+
+            worker = threading.Thread(target=generate, name="stream-generation", daemon=True)
+            worker.start()
+
+            ttft_ms = None
+            pieces = []
+            finished = False
+            try:
+                for text in streamer:
+                    if not text:
+                        continue
+                    if ttft_ms is None:
+                        ttft_ms = round((time.perf_counter() - start) * 1000, 1)
+                        self.ttft_histogram.observe(ttft_ms)
+                    pieces.append(text)
+                    yield {"token": text}
+                finished = True
+            finally:
+                if not finished:
+                    # Closed mid-stream (client gone): stop at the next token
+                    cancel.set()
+                # The lease, and the caller's inference slot, outlive the running model
+                worker.join()
+
+            if cancel.is_set():
+                # Partial answer for a client that went away: neither cached nor reported
+                logger.info(f"Streamed generation cancelled after {len(pieces)} pieces")
+                return
+
+            total_ms = round((time.perf_counter() - start) * 1000, 1)
+            if errors:
+                logger.error(f"Error during streamed generation: {errors[0]}")
+                yield {"error": f"Error al generar respuesta: {str(errors[0])}"}
+            else:
+                self.response_cache.put(question, cache_partition, self.clean_response("".join(pieces)), query_embedding, cache_generation)
+            logger.info(f"Streamed answer: TTFT {ttft_ms} ms, total {total_ms} ms")
+            yield {"done": True, "cached": False, "ttft_ms": ttft_ms, "total_ms": total_ms}
+
+    def retrieve(self, question: str, query_embedding: List[float], is_advisor: bool, k: int = 4, prioritized_programs: Optional[List[str]] = None) -> List[Document]:
+        # Dynamic Retrieval based on Role: only the sub-indexes this role may see are searched
+        partitions = searchable_partitions(is_advisor)
+        logger.info(f"Retrieving from partitions: {', '.join(partitions)}")
+        boost = prioritized_programs if settings.PROGRAM_BOOST_K > 0 else None
+        # The query was embedded outside the lock so an ingestion only blocks the index lookup itself
+        with self._index_lock:
+            if not settings.HYBRID_RETRIEVAL and not boost:
+                return [doc for doc, _ in self.vector_store.search(query_embedding, partitions, k)]
+            fetch_k = max(k, settings.RETRIEVAL_FETCH_K)
+            # The BM25 thread reads under the lock held here, so no ingestion can interleave
+            lexical = None
+            if settings.HYBRID_RETRIEVAL:
+                lexical = self._lexical_pool.submit(self.vector_store.lexical_search, question, partitions, fetch_k)
+            ranked_lists = [[doc_id for doc_id, _ in self.vector_store.search_ids(query_embedding, partitions, fetch_k)]]
+            if lexical is not None:
+                ranked_lists.append([doc_id for doc_id, _ in lexical.result()])
+            if boost:
+                # Chunks naming the programs the rules engine prioritized, so the LLM can actually recommend them
+                ranked_lists.append(self.vector_store.program_chunk_ids(boost, partitions, settings.PROGRAM_BOOST_K))
+            fused = reciprocal_rank_fusion(ranked_lists, k=settings.RRF_K)
+            return self.vector_store.documents(fused[:k])
+
+    def search(self, question: str, is_advisor: bool = False, k: int = 4) -> List[Document]:
+        """Retrieval only; available as soon as the index is loaded, before any generator."""
+        if not self.vector_store:
+            return []
+        return self.retrieve(question, self.embedding_model.embed_query(question), is_advisor, k)
+
+    def build_chain_inputs(self, question: str, query_embedding: List[float], prioritized_programs: List[str], is_advisor: bool, user_info: Dict[str, Any], generator: Optional[GeneratorModel] = None) -> Dict[str, str]:
+        """Build the prompt variables: profile/priority instruction plus the retrieved context, packed to the token budget."""
         profile_summary = []
         if user_info.get("gender"): profile_summary.append(f"Sexo: {user_info['gender']}")
         if user_info.get("age_group"): profile_summary.append(f"Perfil: {user_info['age_group']}")
@@ -269,35 +797,37 @@ Contexto:
         if demographic_context:
             priority_msg = f"{demographic_context}\n{priority_msg}"
             
-        # Dynamic Retrieval based on Role
-        search_kwargs = {"k": 4}
-        if not is_advisor:
-             # Public users ONLY see 'public' docs. Advisors see everything (no filter).
-             search_kwargs["filter"] = {"access": "public"}
+        docs = self.retrieve(question, query_embedding, is_advisor, prioritized_programs=prioritized_programs)
+        tokenizer = generator.tokenizer if generator else None
+        budget = self.context_budget(tokenizer, question, priority_msg)
+        context_str = pack_context(docs, budget, tokenizer)
+
+        return {
+            "question": question, 
+            "priority_instruction": priority_msg,
+            "context": context_str
+        }
+
+    def context_budget(self, tokenizer, question: str, priority_instruction: str) -> int:
+        """CONTEXT_TOKEN_BUDGET, capped by what the model's window leaves after the prompt and the answer."""
+        budget = max(settings.CONTEXT_TOKEN_BUDGET, MIN_SPAN_TOKENS)
+        window = getattr(tokenizer, "model_max_length", None)
+        # Tokenizers without a configured limit report a huge sentinel value
+        if tokenizer is not None and window and window < 1_000_000:
+            prompt = self.prompt.format(question=question, priority_instruction=priority_instruction, context="")
+            available = window - MAX_NEW_TOKENS - len(tokenizer.encode(prompt))
+            if available < MIN_SPAN_TOKENS:
+                logger.warning(f"Prompt leaves {max(available, 0)} tokens of context in a {window}-token window")
+            # Never past the window: a long question can leave less than one span, or nothing
+            budget = max(min(budget, available), 0)
+        return budget
+
+    @staticmethod
+    def clean_response(response: str) -> str:
+        # Cleaning Logic for Phi-2 artifacts
+        clean_response = response.replace("<|endofgeneration|>", "").replace("<|endoftext|>", "").strip()
         
-        logger.info(f"Retrieving with filter: {search_kwargs.get('filter', 'None (Advisor Access)')}")
-        docs = self.vector_store.similarity_search(question, **search_kwargs)
-        context_str = "\n\n".join([d.page_content for d in docs])
-            
-        if not self.rag_chain:
-            return "El modelo de IA no pudo cargarse debido a falta de memoria o un error técnico. Por favor, intenta usar un modelo más ligero (Phi-2) o reinicia el servidor."
-            
-        with self.gpu_memory_management():
-            try:
-                response = self.rag_chain.invoke({
-                    "question": question, 
-                    "priority_instruction": priority_msg,
-                    "context": context_str
-                })
-                
-                # Cleaning Logic for Phi-2 artifacts
-                clean_response = response.replace("<|endofgeneration|>", "").replace("<|endoftext|>", "").strip()
-                
-                # Retrieve only the part after "Output:" if the model repeated the prompt (safety net)
-                if "Output:" in clean_response:
-                    clean_response = clean_response.split("Output:")[-1].strip()
-                    
-                return clean_response
-            except Exception as e:
-                logger.error(f"Error during RAG chain invocation: {e}")
-                return f"Error al generar respuesta: {str(e)}"
+        # Retrieve only the part after "Output:" if the model repeated the prompt (safety net)
+        if "Output:" in clean_response:
+            clean_response = clean_response.split("Output:")[-1].strip()
+        return clean_response
@@ -1,63 +1,346 @@
+import os
 import json
 import logging
-from typing import List, Dict, Any, Union
+import operator
+import threading
+from typing import List, Dict, Any, Callable, Hashable, Optional, Tuple
+import numpy as np
+from caches import LRUCache
 
 logger = logging.getLogger(__name__)
 
+Predicate = Callable[[Dict[str, Any]], bool]
+
+NUMERIC_OPERATORS = {"<": operator.lt, ">": operator.gt, "<=": operator.le, ">=": operator.ge}
+OPERATORS = set(NUMERIC_OPERATORS) | {"==", "!="}
+
+
+class RuleValidationError(ValueError):
+    """The rules file is not a valid rule set; the active rules are kept."""
+
+
+def _always(context: Dict[str, Any]) -> bool:
+    return True
+
+
+def _never(context: Dict[str, Any]) -> bool:
+    return False
+
+
+def compile_condition(condition_block: Dict, path: str = "conditions") -> Predicate:
+    """
+    Compile an AND/OR/NOT condition tree into a predicate over the user
+    context. Leaf semantics: numeric operators only match when both sides are
+    numbers, == is case-insensitive when the user value is a string, and a
+    leaf without field/operator always matches.
+    """
+    if not isinstance(condition_block, dict):
+        raise RuleValidationError(f"{path}: expected an object, got {type(condition_block).__name__}")
+
+    # Handle logic operators
+    if "AND" in condition_block or "OR" in condition_block:
+        key = "AND" if "AND" in condition_block else "OR"
+        children = condition_block[key]
+        if not isinstance(children, list):
+            raise RuleValidationError(f"{path}.{key}: expected a list of conditions")
+        predicates = tuple(compile_condition(c, f"{path}.{key}[{i}]") for i, c in enumerate(children))
+        if key == "AND":
+            return lambda context: all(p(context) for p in predicates)
+        return lambda context: any(p(context) for p in predicates)
+    if "NOT" in condition_block:
+        inner = compile_condition(condition_block["NOT"], f"{path}.NOT")
+        return lambda context: not inner(context)
+
+    # Handle leaf condition (comparison)
+    field = condition_block.get("field")
+    op = condition_block.get("operator")
+    value = condition_block.get("value")
+
+    if not field or op is None:
+        return _always  # Empty condition usually implies match or ignored
+    if op not in OPERATORS:
+        raise RuleValidationError(f"{path}: unknown operator {op!r} (expected one of {', '.join(sorted(OPERATORS))})")
+
+    if op in NUMERIC_OPERATORS:
+        # Type safety for numeric comparisons
+        if not isinstance(value, (int, float)):
+            return _never
+        compare = NUMERIC_OPERATORS[op]
+        return lambda context: isinstance(context.get(field), (int, float)) and compare(context.get(field), value)
+
+    if op == "==":
+        lowered = str(value).lower()
+
+        def equals(context: Dict[str, Any]) -> bool:
+            user_val = context.get(field)
+            return str(user_val).lower() == lowered if isinstance(user_val, str) else user_val == value
+        return equals
+
+    return lambda context: context.get(field) != value
+
+
+class ContextColumns:
+    """
+    A batch of user contexts seen column-wise. Each field is factorized once
+    into integer codes plus its distinct values, so a leaf condition is
+    evaluated on the distinct values only and broadcast to every row.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+        self._factorized: Dict[str, Tuple[np.ndarray, List[Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def factorize(self, field: str) -> Tuple[np.ndarray, List[Any]]:
+        cached = self._factorized.get(field)
+        if cached is not None:
+            return cached
+        codes = np.empty(len(self.rows), dtype=np.int64)
+        index: Dict[Hashable, int] = {}
+        uniques: List[Any] = []
+        for i, row in enumerate(self.rows):
+            value = row.get(field)
+            # Type is part of the key: "5" and 5, or 1 and True, must not share a code
+            key: Hashable = (type(value), value)
+            try:
+                code = index.get(key)
+            except TypeError:
+                key, code = ("unhashable", i), None
+            if code is None:
+                code = index[key] = len(uniques)
+                uniques.append(value)
+            codes[i] = code
+        self._factorized[field] = (codes, uniques)
+        return codes, uniques
+
+
+MaskFn = Callable[[ContextColumns], np.ndarray]
+
+
+def compile_mask(condition_block: Dict) -> MaskFn:
+    """
+    Column-wise counterpart of compile_condition: returns a function giving a
+    boolean mask over a ContextColumns batch. Leaves reuse the compiled leaf
+    predicate on each distinct value, so results match evaluate() exactly.
+    Expects a block that compile_condition already validated.
+    """
+    if "AND" in condition_block or "OR" in condition_block:
+        is_and = "AND" in condition_block
+        children = [compile_mask(c) for c in condition_block["AND" if is_and else "OR"]]
+
+        def combine(columns: ContextColumns) -> np.ndarray:
+            mask = np.full(len(columns), is_and)
+            for child in children:
+                if is_and:
+                    mask &= child(columns)
+                else:
+                    mask |= child(columns)
+            return mask
+        return combine
+    if "NOT" in condition_block:
+        inner = compile_mask(condition_block["NOT"])
+        return lambda columns: ~inner(columns)
+
+    predicate = compile_condition(condition_block)
+    if predicate is _always or predicate is _never:
+        constant = predicate is _always
+        return lambda columns: np.full(len(columns), constant)
+    field = condition_block["field"]
+
+    def leaf(columns: ContextColumns) -> np.ndarray:
+        codes, uniques = columns.factorize(field)
+        table = np.fromiter((predicate({field: value}) for value in uniques), dtype=bool, count=len(uniques))
+        return table[codes]
+    return leaf
+
+
+def context_key(user_context: Dict[str, Any]) -> Optional[Hashable]:
+    """
+    Canonical hashable form of a user context for memoizing evaluate().
+    Types are part of the key since rules compare "5" and 5 differently.
+    Returns None when a value is unhashable.
+    """
+    try:
+        key = tuple(sorted((field, type(value).__name__, value) for field, value in user_context.items()))
+        hash(key)
+        return key
+    except TypeError:
+        return None
+
+
+def compile_rules(rules: Any) -> List[Tuple[Dict, Predicate, List[str]]]:
+    """Validate a parsed rules file and compile it into (rule, predicate, programs) entries."""
+    if not isinstance(rules, list):
+        raise RuleValidationError("the rules file must contain a list of rules")
+    compiled = []
+    seen_ids = set()
+    for i, rule in enumerate(rules):
+        if not isinstance(rule, dict):
+            raise RuleValidationError(f"rule {i}: expected an object")
+        name = rule.get("id", f"#{i}")
+        if name in seen_ids:
+            logger.warning(f"Duplicate rule id {name!r} in rules file")
+        seen_ids.add(name)
+        actions = rule.get("actions", {})
+        programs = actions.get("priority_programs", []) if isinstance(actions, dict) else None
+        if not isinstance(programs, list) or not all(isinstance(p, str) for p in programs):
+            raise RuleValidationError(f"rule {name}: actions.priority_programs must be a list of program names")
+        compiled.append((rule, compile_condition(rule.get("conditions", {}), f"rule {name}.conditions"), programs))
+    return compiled
+
+
 class RulesEngine:
-    def __init__(self, rules_file: str = "priority_rules.json"):
-        self.rules = self._load_rules(rules_file)
+    """
+    Evaluates priority_rules.json against a user context. Rules are validated
+    and compiled into predicates when loaded; reload() (or the file watcher)
+    swaps in a new rule set atomically, and a file that fails to load or
+    validate leaves the active rules in place. Results are memoized per
+    user context and rule-set version.
+    """
 
-    def _load_rules(self, filepath: str) -> List[Dict]:
+    def __init__(self, rules_file: str = "priority_rules.json", cache_size: int = 1024):
+        self.rules_file = rules_file
+        # (rules version, context key) -> prioritized programs
+        self.cache = LRUCache(max_size=cache_size)
+        # (version, raw rules, compiled rules), replaced as a whole on reload
+        self._ruleset: Tuple[int, List[Dict], List[Tuple[Dict, Predicate, List[str]]]] = (0, [], [])
+        self._reload_lock = threading.Lock()
+        self._listeners: List[Callable[[int], None]] = []
+        self._file_stamp: Optional[Tuple[float, int]] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
+        # (raw rules it was built from, mask functions) for evaluate_batch
+        self._mask_cache: Optional[Tuple[List[Dict], List[MaskFn]]] = None
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            self.reload()
         except Exception as e:
-            logger.error(f"Error loading rules from {filepath}: {e}")
-            return []
+            logger.error(f"Error loading rules from {rules_file}: {e}")
+
+    @property
+    def rules(self) -> List[Dict]:
+        return self._ruleset[1]
+
+    @property
+    def version(self) -> int:
+        return self._ruleset[0]
+
+    def add_reload_listener(self, listener: Callable[[int], None]) -> None:
+        """Call listener(new_version) after every successful reload (e.g. to drop cached answers)."""
+        self._listeners.append(listener)
+
+    def _stamp(self) -> Optional[Tuple[float, int]]:
+        try:
+            stat = os.stat(self.rules_file)
+            return stat.st_mtime, stat.st_size
+        except OSError:
+            return None
+
+    def reload(self) -> int:
+        """
+        Load, validate and compile the rules file, then swap it in. Returns the
+        new version. Raises (OSError, ValueError, RuleValidationError) without
+        touching the active rules if the file cannot be used.
+        """
+        with self._reload_lock:
+            stamp = self._stamp()
+            with open(self.rules_file, 'r', encoding='utf-8') as f:
+                rules = json.load(f)
+            compiled = compile_rules(rules)
+            version = self._ruleset[0] + 1
+            self._ruleset = (version, rules, compiled)
+            self._file_stamp = stamp
+            # Entries of older versions can no longer be hit; free them
+            self.cache.clear()
+        logger.info(f"📜 Reglas cargadas: {len(compiled)} reglas (versión {version})")
+        for listener in list(self._listeners):
+            try:
+                listener(version)
+            except Exception as e:
+                logger.error(f"Rules reload listener failed: {e}")
+        return version
+
+    def reload_if_changed(self) -> bool:
+        """Reload when the file's mtime/size changed since the last load attempt."""
+        stamp = self._stamp()
+        if stamp is None or stamp == self._file_stamp:
+            return False
+        try:
+            self.reload()
+            return True
+        except Exception as e:
+            # Remember the bad file so it is not re-parsed (and re-logged) on every poll
+            self._file_stamp = stamp
+            logger.error(f"Rules file {self.rules_file} rejected, keeping version {self.version}: {e}")
+            return False
+
+    def start_watching(self, interval: float) -> None:
+        """Poll the rules file every `interval` seconds in a daemon thread."""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def watch() -> None:
+            while not self._stop_watching.wait(interval):
+                self.reload_if_changed()
+
+        self._watcher = threading.Thread(target=watch, name="rules-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop_watching.set()
 
     def evaluate(self, user_context: Dict[str, Any]) -> List[str]:
         """
         Evaluates user context against rules and returns a list of unique priority programs.
         """
+        version, _, compiled = self._ruleset
+        key = context_key(user_context)
+        if key is not None:
+            cached = self.cache.get((version, key))
+            if cached is not None:
+                return list(cached)
+
         priority_programs = set()
-        
-        for rule in self.rules:
-            if self._check_conditions(rule.get("conditions", {}), user_context):
-                programs = rule.get("actions", {}).get("priority_programs", [])
-                logger.info(f"Rule matched: {rule.get('description')} -> Boosting {programs}")
+        for rule, predicate, programs in compiled:
+            if predicate(user_context):
+                logger.debug("Rule matched: %s -> Boosting %s", rule.get('description'), programs)
                 priority_programs.update(programs)
-                
-        return list(priority_programs)
-
-    def _check_conditions(self, condition_block: Dict, context: Dict) -> bool:
-        # Handle logic operators
-        if "AND" in condition_block:
-            return all(self._check_conditions(cond, context) for cond in condition_block["AND"])
-        if "OR" in condition_block:
-            return any(self._check_conditions(cond, context) for cond in condition_block["OR"])
-        if "NOT" in condition_block:
-            return not self._check_conditions(condition_block["NOT"], context)
-
-        # Handle leaf condition (comparison)
-        field = condition_block.get("field")
-        operator = condition_block.get("operator")
-        value = condition_block.get("value")
-
-        if not field or operator is None:
-            return True # Empty condition usually implies match or ignored
-
-        user_val = context.get(field)
-        
-        # Type safety for numeric comparisons
-        if operator in ["<", ">", "<=", ">="] and (isinstance(user_val, (int, float)) and isinstance(value, (int, float))):
-             if operator == "<": return user_val < value
-             if operator == ">": return user_val > value
-             if operator == "<=": return user_val <= value
-             if operator == ">=": return user_val >= value
-        
-        # Standard equality
-        if operator == "==": return str(user_val).lower() == str(value).lower() if isinstance(user_val, str) else user_val == value
-        if operator == "!=": return user_val != value
-        
-        return False
+
+        result = list(priority_programs)
+        if key is not None:
+            self.cache.put((version, key), tuple(result))
+        return result
+
+    def evaluate_batch(self, user_contexts: List[Dict[str, Any]]) -> List[List[str]]:
+        """
+        Evaluate many user contexts at once, column-wise with boolean masks per
+        rule. Returns, per context, the same programs evaluate() would (in rule
+        order rather than set order).
+        """
+        _, rules, compiled = self._ruleset
+        columns = ContextColumns(user_contexts)
+        # programs x rows: a program applies to a row if any rule naming it matched
+        program_ids: Dict[str, int] = {}
+        for _, _, programs in compiled:
+            for program in programs:
+                program_ids.setdefault(program, len(program_ids))
+        matched = np.zeros((len(program_ids), len(columns)), dtype=bool)
+        for (_, _, programs), mask_fn in zip(compiled, self._masks(rules)):
+            if programs:
+                mask = mask_fn(columns)
+                for program in programs:
+                    matched[program_ids[program]] |= mask
+
+        rows, cols = np.nonzero(matched.T)
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(columns)))))
+        names = np.array(list(program_ids), dtype=object)
+        return [names[cols[start:end]].tolist() for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def _masks(self, rules: List[Dict]) -> List[MaskFn]:
+        # Mask functions are built on first batch use per rules version
+        cached = self._mask_cache
+        if cached is None or cached[0] is not rules:
+            cached = (rules, [compile_mask(rule.get("conditions", {})) for rule in rules])
+            self._mask_cache = cached
+        return cached[1]
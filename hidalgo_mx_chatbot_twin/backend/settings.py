@@ -0,0 +1,112 @@
+import os
+from dotenv import load_dotenv
+
+# Tunables for the backend, overridable from the environment or backend/.env
+load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# --- PDF extraction ---
+# Worker processes used to run pdfminer in parallel (1 = extract in-process, no timeout)
+PDF_EXTRACT_WORKERS = _env_int("PDF_EXTRACT_WORKERS", os.cpu_count() or 1)
+# Seconds a single PDF may run in its worker before the worker is killed and the PDF skipped
+PDF_EXTRACT_TIMEOUT = _env_float("PDF_EXTRACT_TIMEOUT", 300)
+# Directory of the gzip-compressed cleaned-text cache (keyed by PDF hash)
+TEXT_CACHE_DIR = os.environ.get("TEXT_CACHE_DIR", "text_cache")
+
+# --- Embeddings ---
+# Sentences per forward pass of the embedding encoder
+EMBED_BATCH_SIZE = _env_int("EMBED_BATCH_SIZE", 64)
+# Chunks handed to the encoder per indexing step (progress/throughput granularity)
+EMBED_INDEX_BATCH = _env_int("EMBED_INDEX_BATCH", 512)
+# Per-file chunk lists buffered between chunk production and embedding
+EMBED_QUEUE_SIZE = _env_int("EMBED_QUEUE_SIZE", 8)
+# torch intra-op threads (0 = leave torch's default)
+TORCH_NUM_THREADS = _env_int("TORCH_NUM_THREADS", 0)
+
+# --- Caches ---
+# Query embeddings kept for repeated questions (entries / seconds)
+QUERY_CACHE_SIZE = _env_int("QUERY_CACHE_SIZE", 2048)
+QUERY_CACHE_TTL = _env_float("QUERY_CACHE_TTL", 3600)
+# Generated answers kept per (question, model, access level, rules output, profile)
+RESPONSE_CACHE_SIZE = _env_int("RESPONSE_CACHE_SIZE", 512)
+# Cosine similarity above which a cached answer is reused for a paraphrase (0 = exact match only)
+RESPONSE_CACHE_SIMILARITY = _env_float("RESPONSE_CACHE_SIMILARITY", 0)
+
+# --- Inference scheduling ---
+# Answers generated concurrently; more requests wait in a bounded queue.
+# Values > 1 let the generation batcher group concurrent prompts.
+INFERENCE_CONCURRENCY = _env_int("INFERENCE_CONCURRENCY", 1)
+INFERENCE_QUEUE_SIZE = _env_int("INFERENCE_QUEUE_SIZE", 8)
+# Retry-After (seconds) sent with 429 when the queue is full
+INFERENCE_RETRY_AFTER = _env_int("INFERENCE_RETRY_AFTER", 10)
+# Micro-batching of generation: max prompts per batched call (1 = disabled)
+# and how long to wait for more prompts after the first arrives. A batch can
+# only fill with prompts already admitted by the inference queue, so set
+# INFERENCE_CONCURRENCY to at least GENERATION_BATCH_SIZE when enabling it.
+GENERATION_BATCH_SIZE = _env_int("GENERATION_BATCH_SIZE", 1)
+GENERATION_BATCH_WINDOW_MS = _env_float("GENERATION_BATCH_WINDOW_MS", 15)
+
+# --- Generator pool ---
+# Generators kept loaded at once and their combined memory budget (0 = no budget)
+MODEL_POOL_SIZE = _env_int("MODEL_POOL_SIZE", 2)
+MODEL_MEMORY_BUDGET_MB = _env_int("MODEL_MEMORY_BUDGET_MB", 0)
+# Comma-separated friendly model names to load with int8 dynamic quantization (CPU only)
+QUANTIZED_MODELS = {m.strip() for m in os.environ.get("QUANTIZED_MODELS", "").split(",") if m.strip()}
+
+# --- Vector index ---
+# FAISS index type per access partition: flat (exact), ivf_flat, hnsw or ivf_pq.
+# Approximate types fall back to flat while a partition is too small to train.
+INDEX_TYPE = os.environ.get("INDEX_TYPE", "flat").strip().lower()
+# IVF inverted lists (0 = about 4*sqrt(n), capped by the training sample) and lists probed per query
+INDEX_NLIST = _env_int("INDEX_NLIST", 0)
+INDEX_NPROBE = _env_int("INDEX_NPROBE", 16)
+# HNSW graph degree and build/search beam widths
+INDEX_HNSW_M = _env_int("INDEX_HNSW_M", 32)
+INDEX_EF_CONSTRUCTION = _env_int("INDEX_EF_CONSTRUCTION", 80)
+INDEX_EF_SEARCH = _env_int("INDEX_EF_SEARCH", 64)
+# IVF-PQ sub-quantizers (must divide the embedding dimension, 384) and bits per code
+INDEX_PQ_M = _env_int("INDEX_PQ_M", 48)
+INDEX_PQ_NBITS = _env_int("INDEX_PQ_NBITS", 8)
+# Memory-map index files read-only at startup (1) so workers share pages, or read them into memory (0)
+INDEX_MMAP = _env_int("INDEX_MMAP", 1)
+# Several uvicorn workers may share faiss_index/: changes are made by one process at a time
+# (faiss_index/index.lock) and the others reload the saved index after noticing the new
+# manifest, checked every INDEX_RELOAD_INTERVAL seconds (0 = never, e.g. a single worker)
+INDEX_RELOAD_INTERVAL = _env_float("INDEX_RELOAD_INTERVAL", 5)
+# Vectors sampled from the corpus to train IVF/PQ quantizers
+INDEX_TRAIN_SAMPLE = _env_int("INDEX_TRAIN_SAMPLE", 20000)
+
+# --- Retrieval ---
+# Fuse dense (FAISS) and lexical (BM25) results with reciprocal rank fusion (1) or use dense only (0)
+HYBRID_RETRIEVAL = _env_int("HYBRID_RETRIEVAL", 1)
+# Candidates taken from each retriever before fusion, and the RRF rank constant
+RETRIEVAL_FETCH_K = _env_int("RETRIEVAL_FETCH_K", 20)
+RRF_K = _env_int("RRF_K", 60)
+# Chunks per rules-prioritized program injected into the fusion as an extra ranked list (0 = off)
+PROGRAM_BOOST_K = _env_int("PROGRAM_BOOST_K", 2)
+# Upper bound on context tokens sent to the generator (also capped by the model's window)
+CONTEXT_TOKEN_BUDGET = _env_int("CONTEXT_TOKEN_BUDGET", 1024)
+# Largest k accepted by POST /search
+SEARCH_MAX_K = _env_int("SEARCH_MAX_K", 50)
+
+# --- Rules ---
+# Seconds between checks of priority_rules.json for changes (0 = reload only via POST /rules/reload)
+RULES_RELOAD_INTERVAL = _env_float("RULES_RELOAD_INTERVAL", 5)
+# Memoized rule evaluations, keyed by user profile and rules version
+RULES_CACHE_SIZE = _env_int("RULES_CACHE_SIZE", 1024)
+# Roster rows evaluated per column-wise batch by POST /rules/evaluate-batch
+BATCH_EVAL_ROWS = _env_int("BATCH_EVAL_ROWS", 10000)
@@ -0,0 +1,43 @@
+import random
+import pytest
+
+pytest.importorskip("pdfminer")
+
+from bench_clean_text import FRAGMENTS, reference_clean_text, synthetic_document
+from pdf_extraction import clean_text
+
+# Cases around each pass: URLs, page footers spanning lines, blank-line runs at
+# the start, middle and end of the text, mixed whitespace and question marks
+CORPUS = [
+    "",
+    "\n",
+    " \n \n ",
+    "texto",
+    "  \n\n  texto",
+    "texto\n   \n\t\n  \nmás texto",
+    "texto \n \n",
+    "texto\n\n\n",
+    "\x0c\nPágina 3 de 120\n\x0c",
+    "Página\n3\nde\n120 siguiente",
+    "Página 3 de http://x.mx 120",
+    "¿Quién? Consulta https://hidalgo.gob.mx/programas?id=12\n\n?\n\nfin?",
+    "a\r\n\r\nb\x85\n\xa0\nc",
+    "Artículo 5.\n\n\n\n   Artículo 6.",
+]
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_matches_reference_on_corpus(text):
+    assert clean_text(text) == reference_clean_text(text)
+
+
+def test_matches_reference_on_synthetic_document():
+    text = synthetic_document(20)
+    assert clean_text(text) == reference_clean_text(text)
+
+
+def test_matches_reference_on_random_documents():
+    rng = random.Random(1234)
+    for _ in range(20000):
+        text = "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 16)))
+        assert clean_text(text) == reference_clean_text(text), repr(text)
@@ -0,0 +1,20 @@
+import threading
+
+from file_lock import file_lock
+
+
+def test_second_holder_waits_for_release(tmp_path):
+    path = str(tmp_path / "faiss_index" / "index.lock")
+    acquired = threading.Event()
+
+    def contender():
+        # A separate open of the file, as another worker process would do
+        with file_lock(path):
+            acquired.set()
+
+    with file_lock(path):
+        thread = threading.Thread(target=contender)
+        thread.start()
+        assert not acquired.wait(0.2)
+    assert acquired.wait(5)
+    thread.join()
@@ -0,0 +1,17 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+faiss = pytest.importorskip("faiss")
+
+from index_factory import INDEX_TYPES, build_index, index_config, index_kind, min_vectors
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_index_kind_reports_the_built_type(small_pq, index_type):
+    config = index_config(index_type)
+    vectors = np.random.default_rng(0).standard_normal((max(min_vectors(config), 100), 16)).astype("float32")
+    index = build_index(vectors, config)
+    index.add(vectors)
+    assert index_kind(index) == index_type
+    # Also after a round trip through the file format
+    assert index_kind(faiss.deserialize_index(faiss.serialize_index(index))) == index_type
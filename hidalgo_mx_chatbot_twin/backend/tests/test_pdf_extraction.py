@@ -0,0 +1,66 @@
+import os
+import sys
+import pytest
+
+pytest.importorskip("pdfminer")
+
+import pdf_extraction
+from conftest import write_pdf
+
+
+def test_pool_yields_in_order_and_survives_broken_files(tmp_path, monkeypatch):
+    started = []
+    worker_class = pdf_extraction._Worker
+
+    class CountingWorker(worker_class):
+        def __init__(self, results):
+            super().__init__(results)
+            started.append(self)
+
+    monkeypatch.setattr(pdf_extraction, "_Worker", CountingWorker)
+    pdfs = [write_pdf(tmp_path / f"programa_{i}.pdf", f"Programa {i}") for i in range(6)]
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"not a pdf")
+    pdfs.insert(3, broken)
+
+    results = list(pdf_extraction.iter_extracted_texts(pdfs, workers=2, timeout=60))
+
+    assert [r.pdf_path for r in results] == pdfs
+    assert results[3].text is None and results[3].error
+    for i, result in enumerate(results[:3] + results[4:]):
+        assert result.error is None
+        assert result.text.strip() == f"Programa {i}"
+    # A PDF that fails to parse is reported by the worker; only crashes and timeouts replace it
+    assert len(started) == 2
+    assert all(worker.process.returncode == 0 for worker in started)
+
+
+# Worker that dies on "crash" files and hangs on "slow" ones
+FAULTY_WORKER = """
+import os, sys, time
+sys.path.insert(0, {backend!r})
+import pdf_extraction
+extract = pdf_extraction.extract_pdf_text
+def faulty(pdf_path):
+    name = os.path.basename(pdf_path)
+    if name == "crash.pdf":
+        os._exit(3)
+    if name == "slow.pdf":
+        time.sleep(60)
+    return extract(pdf_path)
+pdf_extraction.extract_pdf_text = faulty
+pdf_extraction._serve()
+"""
+
+
+def test_pool_replaces_crashed_and_timed_out_workers(tmp_path, monkeypatch):
+    backend = os.path.dirname(os.path.abspath(pdf_extraction.__file__))
+    monkeypatch.setattr(pdf_extraction, "WORKER_COMMAND", [sys.executable, "-c", FAULTY_WORKER.format(backend=backend)])
+    pdfs = [write_pdf(tmp_path / f"{name}.pdf", name) for name in ("uno", "crash", "dos", "slow", "tres")]
+
+    results = list(pdf_extraction.iter_extracted_texts(pdfs, workers=2, timeout=5))
+
+    assert [r.pdf_path for r in results] == pdfs
+    assert results[1].error == "worker exited with code 3"
+    assert results[3].error == "timed out after 5s"
+    assert [r.text.strip() for r in (results[0], results[2], results[4])] == ["uno", "dos", "tres"]
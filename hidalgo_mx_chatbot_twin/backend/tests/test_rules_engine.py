@@ -0,0 +1,200 @@
+import json
+import os
+import random
+import pytest
+
+pytest.importorskip("numpy")
+
+from rules_engine import OPERATORS, RuleValidationError, RulesEngine
+
+RULE = {
+    "id": "rule_huasteca",
+    "conditions": {"AND": [{"field": "region", "operator": "==", "value": "Huasteca"}]},
+    "actions": {"priority_programs": ["Apoyo al Campo Huasteco"]},
+}
+OTHER_RULE = {
+    "id": "rule_adulto_mayor",
+    "conditions": {"field": "age", "operator": ">=", "value": 65},
+    "actions": {"priority_programs": ["Pensión Adulto Mayor"]},
+}
+
+
+def write_rules(path, content, stamp):
+    path.write_text(content if isinstance(content, str) else json.dumps(content), encoding="utf-8")
+    # Explicit mtimes: rewrites within the filesystem's timestamp granularity still register
+    os.utime(path, (stamp, stamp))
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    path = tmp_path / "priority_rules.json"
+    write_rules(path, [RULE], 1_000_000)
+    return path
+
+
+def test_reload_swaps_rules_bumps_version_and_clears_memo(rules_file):
+    engine = RulesEngine(str(rules_file))
+    versions = []
+    engine.add_reload_listener(versions.append)
+    assert engine.version == 1
+    assert engine.evaluate({"region": "huasteca", "age": 70}) == ["Apoyo al Campo Huasteco"]
+    assert len(engine.cache) == 1
+
+    write_rules(rules_file, [RULE, OTHER_RULE], 1_000_001)
+    assert engine.reload() == 2
+
+    assert engine.version == 2
+    assert versions == [2]
+    assert len(engine.cache) == 0
+    assert sorted(engine.evaluate({"region": "huasteca", "age": 70})) == ["Apoyo al Campo Huasteco", "Pensión Adulto Mayor"]
+
+
+@pytest.mark.parametrize("content, error", [
+    ('[{"id": "rule_huasteca", "conditions": ', json.JSONDecodeError),
+    ({"id": "not a list"}, RuleValidationError),
+    ([{"id": "r", "conditions": {"field": "age", "operator": "=~", "value": 1}}], RuleValidationError),
+    ([{"id": "r", "conditions": {"AND": {"field": "age"}}}], RuleValidationError),
+    ([{"id": "r", "actions": {"priority_programs": "Apoyo Urbano"}}], RuleValidationError),
+])
+def test_rejected_file_keeps_active_rules(rules_file, content, error):
+    engine = RulesEngine(str(rules_file))
+    versions = []
+    engine.add_reload_listener(versions.append)
+    engine.evaluate({"region": "Huasteca"})
+
+    write_rules(rules_file, content, 1_000_001)
+    with pytest.raises(error):
+        engine.reload()
+
+    assert engine.version == 1
+    assert engine.rules == [RULE]
+    assert versions == []
+    assert engine.evaluate({"region": "Huasteca"}) == ["Apoyo al Campo Huasteco"]
+
+
+def test_reload_if_changed(rules_file):
+    engine = RulesEngine(str(rules_file))
+    versions = []
+    engine.add_reload_listener(versions.append)
+    assert not engine.reload_if_changed()
+
+    write_rules(rules_file, "{not json", 1_000_001)
+    assert not engine.reload_if_changed()
+    assert engine.version == 1
+    # The rejected file is not re-read until it changes again
+    assert not engine.reload_if_changed()
+
+    write_rules(rules_file, [RULE, OTHER_RULE], 1_000_002)
+    assert engine.reload_if_changed()
+    assert engine.version == 2
+    assert versions == [2]
+    assert engine.evaluate({"age": 80}) == ["Pensión Adulto Mayor"]
+
+
+def test_missing_file_starts_empty(tmp_path):
+    engine = RulesEngine(str(tmp_path / "missing.json"))
+    assert engine.version == 0
+    assert engine.evaluate({"region": "Huasteca"}) == []
+
+
+# --- Randomized comparison against the interpreter the compiled rules replaced ---
+
+def reference_check_conditions(condition_block, context):
+    """The pre-compilation RulesEngine._check_conditions, kept verbatim as the reference."""
+    if "AND" in condition_block:
+        return all(reference_check_conditions(cond, context) for cond in condition_block["AND"])
+    if "OR" in condition_block:
+        return any(reference_check_conditions(cond, context) for cond in condition_block["OR"])
+    if "NOT" in condition_block:
+        return not reference_check_conditions(condition_block["NOT"], context)
+
+    field = condition_block.get("field")
+    operator = condition_block.get("operator")
+    value = condition_block.get("value")
+
+    if not field or operator is None:
+        return True
+
+    user_val = context.get(field)
+
+    if operator in ["<", ">", "<=", ">="] and (isinstance(user_val, (int, float)) and isinstance(value, (int, float))):
+        if operator == "<": return user_val < value
+        if operator == ">": return user_val > value
+        if operator == "<=": return user_val <= value
+        if operator == ">=": return user_val >= value
+
+    if operator == "==": return str(user_val).lower() == str(value).lower() if isinstance(user_val, str) else user_val == value
+    if operator == "!=": return user_val != value
+
+    return False
+
+
+def reference_evaluate(rules, context):
+    programs = set()
+    for rule in rules:
+        if reference_check_conditions(rule.get("conditions", {}), context):
+            programs.update(rule.get("actions", {}).get("priority_programs", []))
+    return programs
+
+
+FIELDS = ["age", "age_group", "region", "occupation", "gender", "is_student", "children", "parents_residence"]
+# Mixed types on purpose: "5" vs 5, 1 vs True vs 1.0, case variants, None
+VALUES = [0, 1, 5, 17, 18, 64, 65, 80, 2.5, 1.0, True, False, None, "5", "Huasteca", "huasteca", "HUASTECA",
+          "Zempoala", "Joven", "Adulto Mayor", "Mujer", "Hombre", "Ejidatario", "", "Otomí-Tepehua"]
+PROGRAMS = ["Apoyo al Campo Huasteco", "Beca Transporte Zempoala", "Apoyo Urbano", "Pensión Adulto Mayor",
+            "Artesanía Regional", "Seguridad Alimentaria", "Beca Joven"]
+
+
+def random_condition(rng, depth=0):
+    roll = rng.random()
+    if depth < 3 and roll < 0.3:
+        key = rng.choice(["AND", "OR"])
+        return {key: [random_condition(rng, depth + 1) for _ in range(rng.randint(0, 3))]}
+    if depth < 3 and roll < 0.4:
+        return {"NOT": random_condition(rng, depth + 1)}
+    if roll < 0.45:
+        # Leaves without field or operator always match
+        return rng.choice([{}, {"field": rng.choice(FIELDS)}, {"operator": "=="}])
+    return {"field": rng.choice(FIELDS), "operator": rng.choice(sorted(OPERATORS)), "value": rng.choice(VALUES)}
+
+
+def random_rules(rng, count):
+    return [
+        {"id": f"rule_{i}", "conditions": random_condition(rng),
+         "actions": {"priority_programs": rng.sample(PROGRAMS, rng.randint(0, 3))}}
+        for i in range(count)
+    ]
+
+
+def random_contexts(rng, count):
+    return [{field: rng.choice(VALUES) for field in rng.sample(FIELDS, rng.randint(0, len(FIELDS)))} for _ in range(count)]
+
+
+def test_compiled_rules_match_reference_interpreter(tmp_path):
+    rng = random.Random(2024)
+    rules = random_rules(rng, 50)
+    path = tmp_path / "priority_rules.json"
+    write_rules(path, rules, 1_000_000)
+    engine = RulesEngine(str(path), cache_size=0)
+
+    for context in random_contexts(rng, 5000):
+        assert set(engine.evaluate(context)) == reference_evaluate(rules, context), context
+
+
+def test_evaluate_batch_matches_evaluate(tmp_path):
+    rng = random.Random(7)
+    path = tmp_path / "priority_rules.json"
+    write_rules(path, random_rules(rng, 50), 1_000_000)
+    engine = RulesEngine(str(path), cache_size=0)
+    contexts = random_contexts(rng, 20000)
+
+    batch = engine.evaluate_batch(contexts)
+
+    assert len(batch) == len(contexts)
+    for context, programs in zip(contexts, batch):
+        assert len(programs) == len(set(programs))
+        assert set(programs) == set(engine.evaluate(context)), context
+
+
+def test_evaluate_batch_empty(rules_file):
+    assert RulesEngine(str(rules_file)).evaluate_batch([]) == []
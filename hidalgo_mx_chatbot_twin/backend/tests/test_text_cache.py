@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("pdfminer")
+pytest.importorskip("torch")
+pytest.importorskip("langchain_huggingface")
+
+import pdf_extraction
+import rag_engine
+import settings
+from index_manifest import file_sha256
+from text_cache import TextCache
+from conftest import write_pdf
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_uncached_pdfs_are_cached_under_their_own_hash(tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(settings, "PDF_EXTRACT_WORKERS", workers)
+    pdfs = [write_pdf(tmp_path / f"{name}.pdf", f"Reglas de operacion del programa {name.upper()}") for name in ("a", "b", "c")]
+    texts = [pdf_extraction.extract_pdf_text(str(path))[0] for path in pdfs]
+
+    backend = object.__new__(rag_engine.ChatbotBackend)
+    backend.text_cache = TextCache(str(tmp_path / "text_cache"))
+    # a.pdf already cached; b.pdf and c.pdf go through extraction
+    backend.text_cache.put(file_sha256(pdfs[0]), pdf_extraction.clean_text(texts[0]))
+
+    results = list(backend.iter_cleaned_texts(pdfs))
+
+    assert [r.pdf_path for r in results] == pdfs
+    for path, text, result in zip(pdfs, texts, results):
+        expected = pdf_extraction.clean_text(text)
+        assert result.error is None
+        assert result.text == expected
+        assert backend.text_cache.get(file_sha256(path)) == expected
@@ -0,0 +1,70 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+pytest.importorskip("langchain_community")
+
+import settings
+from index_factory import index_kind
+from vector_index import PartitionedIndex
+
+
+def build(index_path, n=800, dim=16):
+    vectors = np.random.default_rng(0).standard_normal((n, dim)).astype("float32")
+    ids = [f"chunk-{i}" for i in range(n)]
+    index = PartitionedIndex.create(index_path, embedding_model=None)
+    index.add(
+        [(f"fragmento {i}", vector.tolist()) for i, vector in enumerate(vectors)],
+        [{"source": "reglas.pdf", "access": "public"} for _ in ids],
+        ids,
+    )
+    return index, vectors, ids
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw", "ivf_pq"])
+def test_delete_from_partition(tmp_path, monkeypatch, small_pq, index_type):
+    monkeypatch.setattr(settings, "INDEX_TYPE", index_type)
+    index, vectors, ids = build(str(tmp_path))
+    assert index_kind(index.stores["public"].index) == index_type
+
+    assert index.delete(ids[:10]) == 10
+
+    store = index.stores["public"]
+    assert index_kind(store.index) == index_type
+    assert store.index.ntotal == len(ids) - 10
+    assert sorted(store.index_to_docstore_id.values()) == sorted(ids[10:])
+    if index_type != "ivf_pq":
+        # Exact vectors: a surviving chunk is still its own nearest neighbour
+        found = index.search(vectors[500].tolist(), ["public"], k=1)
+        assert found[0][0].page_content == "fragmento 500"
+    assert not {doc.page_content for doc, _ in index.search(vectors[3].tolist(), ["public"], k=20)} & {f"fragmento {i}" for i in range(10)}
+
+    index.save(str(tmp_path))
+    reloaded = PartitionedIndex.load(str(tmp_path), embedding_model=None)
+    assert reloaded.stores["public"].index.ntotal == len(ids) - 10
+
+
+def test_prepared_update_is_invisible_until_applied(tmp_path):
+    index, vectors, ids = build(str(tmp_path), n=50)
+    index.save(str(tmp_path))
+    index = PartitionedIndex.load(str(tmp_path), embedding_model=None, mmap=True)
+    live = index.stores["public"]
+    new_vector = (vectors[0] + 100).tolist()
+
+    update = index.prepare_update(
+        ids[:5], [("fragmento nuevo", new_vector)], [{"source": "nuevo.pdf", "access": "public"}], ["chunk-new"]
+    )
+
+    # Searches still see the loaded partition, deleted chunks included
+    assert index.stores["public"] is live
+    assert live.index.ntotal == 50
+    assert index.documents(ids[:1])[0].page_content == "fragmento 0"
+    assert index.lexical_search("fragmento 0", ["public"], k=50)
+
+    index.apply(update)
+
+    assert index.stores["public"].index.ntotal == 46
+    assert "public" not in index.mmapped
+    assert index.documents(ids[:5]) == []
+    assert index.search(new_vector, ["public"], k=1)[0][0].page_content == "fragmento nuevo"
+    assert "chunk-new" in {doc_id for doc_id, _ in index.lexical_search("nuevo", ["public"], k=5)}
@@ -0,0 +1,45 @@
+import os
+import gzip
+import logging
+from typing import Optional
+from pdf_extraction import CLEAN_TEXT_VERSION
+
+logger = logging.getLogger(__name__)
+
+
+class TextCache:
+    """
+    Disk cache of cleaned PDF text, keyed by the PDF's content hash and the
+    clean_text version, stored gzip-compressed. Lets re-chunking or
+    re-embedding skip pdfminer entirely.
+    """
+
+    def __init__(self, cache_dir: str = "text_cache"):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, f"{sha256}.v{CLEAN_TEXT_VERSION}.txt.gz")
+
+    def __contains__(self, sha256: str) -> bool:
+        return os.path.exists(self._path(sha256))
+
+    def get(self, sha256: str) -> Optional[str]:
+        try:
+            with gzip.open(self._path(sha256), 'rt', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable text cache entry {sha256}: {e}")
+            return None
+
+    def put(self, sha256: str, text: str) -> None:
+        path = self._path(sha256)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write text cache entry {sha256}: {e}")
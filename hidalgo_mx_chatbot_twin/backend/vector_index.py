@@ -0,0 +1,282 @@
+import os
+import logging
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from index_factory import (
+    build_index, heap_copy, index_config, index_kind, min_vectors, read_index, reconstruct_all,
+    set_search_params, write_index,
+)
+from chunk_store import CHUNK_STORE_FILE, ChunkStore
+from bm25_index import BM25Index, term_frequencies
+import settings
+
+logger = logging.getLogger(__name__)
+
+# Access levels, each stored in its own FAISS sub-index (faiss_index/<access>/)
+ACCESS_LEVELS = ("public", "advisor")
+
+
+class IndexUpdate(NamedTuple):
+    """Changes built by PartitionedIndex.prepare_update without touching the live index."""
+    # Replacement store per changed partition
+    stores: Dict[str, FAISS]
+    # Chunks dropped from those partitions
+    removed_ids: List[str]
+    # BM25 entries to add: (ids, term frequencies, access levels)
+    lexical: Tuple[List[str], List[Dict[str, int]], List[str]]
+
+
+class PartitionedIndex:
+    """
+    One FAISS store per access level. Public queries search only the public
+    sub-index, so they get exactly k public results without over-fetching and
+    post-filtering; advisor queries search every sub-index and merge by score.
+    Sub-indexes use the FAISS index type from settings (see index_factory);
+    chunk text and metadata live in a shared SQLite ChunkStore. A BM25 index
+    over the same chunks is kept in step for lexical retrieval.
+    """
+
+    def __init__(self, embedding_model, chunk_store: ChunkStore, stores: Optional[Dict[str, FAISS]] = None,
+                 config: Optional[Dict[str, Any]] = None, lexical: Optional[BM25Index] = None):
+        self.embedding_model = embedding_model
+        self.chunk_store = chunk_store
+        self.lexical = lexical if lexical is not None else BM25Index()
+        self.lexical_dirty = lexical is None
+        self.stores: Dict[str, FAISS] = stores or {}
+        self.config = config or index_config()
+        # Partitions whose index is a read-only memory map of the file on disk
+        self.mmapped: Set[str] = set()
+        # Partitions changed since they were loaded or last saved
+        self.dirty: Set[str] = set(self.stores)
+
+    @classmethod
+    def load(cls, index_path: str, embedding_model, mmap: Optional[bool] = None) -> "PartitionedIndex":
+        mmap = bool(settings.INDEX_MMAP) if mmap is None else mmap
+        chunk_store = ChunkStore(os.path.join(index_path, CHUNK_STORE_FILE))
+        stores, mmapped = {}, set()
+        for access in ACCESS_LEVELS:
+            path = os.path.join(index_path, access, "index.faiss")
+            if not os.path.exists(path):
+                continue
+            index, is_mmapped = read_index(path, mmap)
+            set_search_params(index)
+            index_to_docstore_id = chunk_store.id_map(access)
+            if len(index_to_docstore_id) != index.ntotal:
+                raise ValueError(f"Sub-index '{access}' has {index.ntotal} vectors but {len(index_to_docstore_id)} stored ids")
+            stores[access] = FAISS(embedding_model, index, chunk_store, index_to_docstore_id)
+            if is_mmapped:
+                mmapped.add(access)
+        lexical = BM25Index.load(index_path)
+        if lexical is None:
+            logger.info("No BM25 index on disk; building it from the chunk store...")
+            lexical = BM25Index()
+            ids, texts, accesses = [], [], []
+            for doc_id, text, metadata in chunk_store.iter_chunks():
+                ids.append(doc_id)
+                texts.append(text)
+                accesses.append(metadata.get("access", "public"))
+            lexical.add(ids, texts, accesses)
+            lexical_dirty = True
+        else:
+            lexical_dirty = False
+        partitioned = cls(embedding_model, chunk_store, stores, lexical=lexical)
+        partitioned.lexical_dirty = lexical_dirty
+        partitioned.mmapped = mmapped
+        partitioned.dirty = set()
+        return partitioned
+
+    @classmethod
+    def create(cls, index_path: str, embedding_model) -> "PartitionedIndex":
+        """Empty index for a full rebuild; chunks left from a previous index are dropped."""
+        os.makedirs(index_path, exist_ok=True)
+        # Files of the former single-store layout, whose docstore was a pickle
+        stale = ["index.faiss", "index.pkl"] + [os.path.join(access, "index.pkl") for access in ACCESS_LEVELS]
+        # Sub-indexes of the previous build: a partition the rebuild does not produce again
+        # would otherwise be loaded next time against an emptied id map
+        stale += [os.path.join(access, "index.faiss") for access in ACCESS_LEVELS]
+        for name in stale:
+            if os.path.exists(os.path.join(index_path, name)):
+                os.remove(os.path.join(index_path, name))
+        chunk_store = ChunkStore(os.path.join(index_path, CHUNK_STORE_FILE))
+        chunk_store.clear()
+        return cls(embedding_model, chunk_store)
+
+    def save(self, index_path: str) -> None:
+        # Only changed partitions are written; unchanged ones may be mapped from these very files
+        for access in sorted(self.dirty):
+            store = self.stores[access]
+            path = os.path.join(index_path, access)
+            os.makedirs(path, exist_ok=True)
+            write_index(store.index, os.path.join(path, "index.faiss"))
+            self.chunk_store.set_id_map(access, store.index_to_docstore_id)
+        if self.lexical_dirty:
+            self.lexical.save(index_path)
+            self.lexical_dirty = False
+        self.chunk_store.commit()
+        self.dirty.clear()
+
+    @property
+    def ntotal(self) -> int:
+        return sum(store.index.ntotal for store in self.stores.values())
+
+    def stored_ids(self) -> Set[str]:
+        ids = set()
+        for store in self.stores.values():
+            ids.update(store.index_to_docstore_id.values())
+        return ids
+
+    def add(self, text_embeddings: List[Tuple[str, List[float]]], metadatas: List[dict], ids: List[str]) -> None:
+        self.apply(self.prepare_update([], text_embeddings, metadatas, ids))
+
+    def delete(self, ids: Iterable[str]) -> int:
+        update = self.prepare_update(ids, [], [], [])
+        self.apply(update)
+        return len(update.removed_ids)
+
+    def prepare_update(self, delete_ids: Iterable[str], text_embeddings: List[Tuple[str, List[float]]],
+                       metadatas: List[dict], ids: List[str]) -> IndexUpdate:
+        """
+        Build the partitions that deleting `delete_ids` and adding the given chunks
+        produces, on copies: searches keep using the current partitions meanwhile.
+        New chunk rows are written to the chunk store, where nothing references them
+        yet. Updates must not be prepared concurrently; apply() makes one visible.
+        """
+        delete_ids = set(delete_ids)
+        by_access: Dict[str, Tuple[list, list, list]] = {}
+        for pair, metadata, doc_id in zip(text_embeddings, metadatas, ids):
+            group = by_access.setdefault(metadata.get("access", "public"), ([], [], []))
+            group[0].append(pair)
+            group[1].append(metadata)
+            group[2].append(doc_id)
+
+        stores: Dict[str, FAISS] = {}
+        removed: List[str] = []
+        for access, store in self.stores.items():
+            owned = [doc_id for doc_id in store.index_to_docstore_id.values() if doc_id in delete_ids]
+            if owned or access in by_access:
+                stores[access] = self._copy_without(access, store, delete_ids)
+                removed.extend(owned)
+        for access, (pairs, metas, doc_ids) in by_access.items():
+            store = stores.get(access)
+            if store is None:
+                vectors = np.asarray([embedding for _, embedding in pairs], dtype="float32")
+                store = FAISS(self.embedding_model, build_index(vectors, self.config), self.chunk_store, {})
+                stores[access] = store
+                store.add_embeddings(pairs, metadatas=metas, ids=doc_ids)
+            else:
+                store.add_embeddings(pairs, metadatas=metas, ids=doc_ids)
+                self._maybe_upgrade(access, store)
+
+        lexical = (list(ids), [term_frequencies(text) for text, _ in text_embeddings], [m.get("access", "public") for m in metadatas])
+        return IndexUpdate(stores, removed, lexical)
+
+    def apply(self, update: IndexUpdate) -> None:
+        """Swap in a prepared update. Only reference swaps and dict updates, so it is quick to hold a lock around."""
+        self.stores.update(update.stores)
+        self.mmapped.difference_update(update.stores)
+        self.dirty.update(update.stores)
+        self.lexical.delete(update.removed_ids)
+        self.lexical.add_counts(*update.lexical)
+        self.lexical_dirty = True
+        # Removed only now: searches of the replaced partitions could still return them
+        self.chunk_store.delete(update.removed_ids)
+
+    def _copy_without(self, access: str, store: FAISS, ids: Set[str]) -> FAISS:
+        """
+        Writable in-memory copy of a partition's store without `ids`. IVF ids are not
+        compacted by remove_ids and HNSW cannot remove at all, so those re-add the
+        surviving vectors to an emptied copy that keeps its trained quantizers.
+        """
+        keep = [pos for pos, doc_id in sorted(store.index_to_docstore_id.items()) if doc_id not in ids]
+        # heap_copy returns an index Python owns; a downcast of clone_index's result does
+        # not keep the clone alive, so it would be freed under us. It also turns a
+        # read-only memory map into an index that can be changed.
+        index = heap_copy(store.index)
+        if access in self.mmapped:
+            logger.info(f"Sub-index '{access}' copied into memory for updating")
+        if len(keep) < index.ntotal:
+            if index_kind(index) == "flat":
+                # Flat removal shifts the survivors down in order, matching `keep`
+                dropped = sorted(set(store.index_to_docstore_id) - set(keep))
+                index.remove_ids(np.asarray(dropped, dtype="int64"))
+            else:
+                vectors = reconstruct_all(index)[keep]
+                index.reset()
+                if len(vectors):
+                    index.add(vectors)
+        set_search_params(index)
+        id_map = {new: store.index_to_docstore_id[old] for new, old in enumerate(keep)}
+        return FAISS(self.embedding_model, index, self.chunk_store, id_map)
+
+    def _maybe_upgrade(self, access: str, store: FAISS) -> None:
+        # A partition created while too small to train stays flat; retrain once it has grown enough
+        if self.config["type"] == "flat" or index_kind(store.index) != "flat":
+            return
+        if store.index.ntotal < min_vectors(self.config):
+            return
+        vectors = reconstruct_all(store.index)
+        index = build_index(vectors, self.config)
+        index.add(vectors)
+        store.index = index
+        logger.info(f"Sub-index '{access}' upgraded from flat to {self.config['type']} ({index.ntotal} vectors)")
+
+    def search_ids(self, query_embedding: List[float], partitions: Iterable[str], k: int = 4) -> List[Tuple[str, float]]:
+        """Top-k (docstore id, L2 distance) over the given access partitions, best first."""
+        vector = np.asarray([query_embedding], dtype="float32")
+        results = []
+        for access in partitions:
+            store = self.stores.get(access)
+            if store is None or not store.index.ntotal:
+                continue
+            distances, positions = store.index.search(vector, k)
+            results.extend(
+                (store.index_to_docstore_id[position], float(distance))
+                for distance, position in zip(distances[0], positions[0]) if position != -1
+            )
+        results.sort(key=lambda pair: pair[1])
+        return results[:k]
+
+    def lexical_search(self, query: str, partitions: Iterable[str], k: int = 4) -> List[Tuple[str, float]]:
+        """Top-k (docstore id, BM25 score) over the given access partitions, best first."""
+        return self.lexical.search(query, partitions, k)
+
+    def program_chunk_ids(self, programs: Iterable[str], partitions: Iterable[str], per_program: int = 2) -> List[str]:
+        """Chunks naming the given programs, interleaved so every program gets an early rank."""
+        partitions = tuple(partitions)
+        per_name = [self.lexical.program_chunks(name, partitions, per_program) for name in programs]
+        ranked = []
+        for rank in range(per_program):
+            for ids in per_name:
+                if rank < len(ids) and ids[rank] not in ranked:
+                    ranked.append(ids[rank])
+        return ranked
+
+    def documents(self, ids: Iterable[str]) -> List[Document]:
+        """Fetch chunks by docstore id from the chunk store, keeping the given order."""
+        docs = [self.chunk_store.search(doc_id) for doc_id in ids]
+        return [doc for doc in docs if isinstance(doc, Document)]
+
+    def search(self, query_embedding: List[float], partitions: Iterable[str], k: int = 4) -> List[Tuple[Document, float]]:
+        """Top-k (document, L2 distance) over the given access partitions, best first."""
+        results = []
+        for doc_id, score in self.search_ids(query_embedding, partitions, k):
+            doc = self.chunk_store.search(doc_id)
+            if isinstance(doc, Document):
+                results.append((doc, score))
+        return results
+
+
+def reciprocal_rank_fusion(ranked_lists: Iterable[List[str]], k: int = 60) -> List[str]:
+    """Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in."""
+    scores: Dict[str, float] = {}
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
+
+
+def searchable_partitions(is_advisor: bool) -> Tuple[str, ...]:
+    # Public users ONLY see 'public' docs. Advisors see everything.
+    return ACCESS_LEVELS if is_advisor else ("public",)